@@ -0,0 +1,302 @@
+import bisect
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict
+from assessment_bank import LEVEL_DIFFICULTY, get_assessment_bank
+from assessment_schema import MultipleChoiceQuestion, choice_index
+from course_filters import normalize_value
+
+# Adaptive multiple-choice assessment driven by a Rasch (1PL item-response) model.
+# The learner's ability and each question's difficulty live on the same logit
+# scale; P(correct) = 1 / (1 + exp(difficulty - ability)). After every answer
+# both are nudged Elo-style by the prediction error, which is O(1). The next
+# question is the unused one whose difficulty is closest to the current ability
+# (where the answer tells us most), found by bisecting a per-topic list sorted
+# by difficulty. The LLM is only called, in the background, to top up a topic
+# when the bank has no question near the learner's ability.
+
+DEFAULT_MAX_ITEMS = 10
+
+# Ability step size: large at first so the estimate converges quickly, then shrinking
+ABILITY_STEP = 0.8
+MIN_ABILITY_STEP = 0.25
+# Question difficulties move slowly, since every learner recalibrates them
+DIFFICULTY_STEP = 0.05
+
+# Questions further than this from the ability estimate trigger a bank top-up
+DIFFICULTY_TOLERANCE = 0.75
+
+# How long next_item waits for a running top-up when no question is left
+DEFAULT_TOP_UP_WAIT_SECONDS = 2.0
+
+# Tops up the assessment bank while the learner keeps answering
+_top_up_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="assessment-top-up")
+
+def probability_correct(ability, difficulty):
+    return 1.0 / (1.0 + math.exp(difficulty - ability))
+
+def level_for_ability(ability):
+    """
+    The experience level whose starting difficulty is closest to an ability estimate.
+    """
+    level = min(LEVEL_DIFFICULTY, key=lambda name: abs(LEVEL_DIFFICULTY[name] - ability))
+    return level.title()
+
+class ItemPool:
+    """
+    Multiple-choice questions per topic, each list sorted by difficulty.
+    """
+
+    def __init__(self):
+        self._difficulties = {}
+        self._items = {}
+        self._questions = set()
+
+    def add(self, topic, difficulty, item, item_id=None):
+        """
+        Add a question; invalid questions and repeats of a question already in the pool are skipped.
+        """
+        question = MultipleChoiceQuestion.from_dict(item)
+        if question is None or question.question in self._questions:
+            return False
+        self._questions.add(question.question)
+        entry = {"id": item_id, "topic": topic, "difficulty": difficulty, "item": asdict(question)}
+        difficulties = self._difficulties.setdefault(topic, [])
+        items = self._items.setdefault(topic, [])
+        index = bisect.bisect(difficulties, difficulty)
+        difficulties.insert(index, difficulty)
+        items.insert(index, entry)
+        return True
+
+    def topics(self):
+        return list(self._items)
+
+    def nearest(self, topic, ability, used):
+        """
+        The unused question of a topic whose difficulty is closest to the ability.
+
+        Args:
+            topic (str): The topic
+            ability (float): The learner's ability estimate
+            used (set): Questions already asked
+
+        Returns:
+            dict: The question entry, or None if the topic has no unused question
+        """
+        difficulties = self._difficulties.get(topic, [])
+        items = self._items.get(topic, [])
+        above = bisect.bisect_left(difficulties, ability)
+        below = above - 1
+        while below >= 0 or above < len(items):
+            if above >= len(items) or (below >= 0 and ability - difficulties[below] <= difficulties[above] - ability):
+                candidate, below = items[below], below - 1
+            else:
+                candidate, above = items[above], above + 1
+            if candidate["item"]["question"] not in used:
+                return candidate
+        return None
+
+class AdaptiveAssessment:
+    """
+    One learner's adaptive assessment over the topics of their learning path.
+
+    Topics are asked in rotation (the least-asked topic with questions left),
+    so the assessment covers the whole path. Only the topic of the question
+    about to be asked is topped up, so at most one LLM call starts per question.
+    """
+
+    def __init__(self, topics, user_info, pool=None, max_items=None, bank=None):
+        self.topics = list(dict.fromkeys(topics))
+        self.user_info = dict(user_info)
+        self.pool = pool or ItemPool()
+        self.max_items = max_items or int(os.getenv("ADAPTIVE_MAX_ITEMS", DEFAULT_MAX_ITEMS))
+        self.bank = bank
+        level = normalize_value(self.user_info.get("experience_level", "Beginner"))
+        self.ability = LEVEL_DIFFICULTY.get(level, 0.0)
+        self.responses = []
+        self.current = None
+        self.top_up_wait = float(os.getenv("ADAPTIVE_TOP_UP_WAIT_SECONDS", DEFAULT_TOP_UP_WAIT_SECONDS))
+        self._top_ups = {}
+
+    @property
+    def finished(self):
+        return len(self.responses) >= self.max_items
+
+    @property
+    def pending(self):
+        """
+        Whether questions are still being generated; next_item may have more after they arrive.
+        """
+        return any(future is not None and not future.done() for future in self._top_ups.values())
+
+    def next_item(self):
+        """
+        Choose the next question, or return the current one if it hasn't been answered.
+
+        Returns:
+            dict: The question entry (id, topic, difficulty, item), or None when the
+                assessment is over or out of questions. While pending is True, None
+                only means the next questions are still being generated.
+        """
+        if self.current is not None:
+            return self.current
+        if self.finished:
+            return None
+        best = self._choose_item()
+        if best is None and self.pending:
+            # Out of questions while a top-up is running: give it a moment before giving up
+            wait([future for future in self._top_ups.values() if future is not None],
+                 timeout=self.top_up_wait, return_when=FIRST_COMPLETED)
+            best = self._choose_item()
+        self.current = best
+        return best
+
+    def _choose_item(self):
+        self._merge_top_ups()
+        used = {response["question"] for response in self.responses}
+        asked = {topic: 0 for topic in self.topics}
+        for response in self.responses:
+            asked[response["topic"]] = asked.get(response["topic"], 0) + 1
+
+        candidates = []
+        for topic in self.topics:
+            candidate = self.pool.nearest(topic, self.ability, used)
+            if candidate is not None:
+                candidates.append((asked.get(topic, 0), abs(candidate["difficulty"] - self.ability), candidate))
+        if candidates:
+            # Least-asked topic first, then the question closest to the ability
+            best = min(candidates, key=lambda candidate: candidate[:2])
+            if best[1] > DIFFICULTY_TOLERANCE:
+                # Only the topic about to be asked is topped up
+                self._request_top_up(best[2]["topic"])
+            return best[2]
+        # Out of questions: top up the least-asked topic not already requested
+        for topic in sorted(self.topics, key=lambda topic: asked.get(topic, 0)):
+            if self._request_top_up(topic):
+                break
+        return None
+
+    def answer(self, choice):
+        """
+        Score the answer to the current question and update the ability estimate.
+
+        Args:
+            choice: The chosen option (letter, option text or 0-based index)
+
+        Returns:
+            dict: The response record (question, topic, correct, correct_answer, ability)
+        """
+        entry = self.current
+        if entry is None:
+            raise ValueError("There is no question to answer")
+        item = entry["item"]
+        correct_index = choice_index(item["correct_answer"], item["options"])
+        correct = choice_index(choice, item["options"]) == correct_index
+        expected = probability_correct(self.ability, entry["difficulty"])
+        step = max(MIN_ABILITY_STEP, ABILITY_STEP / math.sqrt(1 + len(self.responses)))
+        self.ability += step * (correct - expected)
+        if self.bank is not None and entry["id"] is not None:
+            # Recalibrated in the bank for later sessions; this pool keeps its sort order
+            _top_up_executor.submit(self.bank.adjust_difficulties, {entry["id"]: -DIFFICULTY_STEP * (correct - expected)})
+
+        response = {
+            "question": item["question"],
+            "topic": entry["topic"],
+            "answer": choice,
+            "correct": correct,
+            "correct_answer": item["options"][correct_index],
+            "ability": self.ability,
+        }
+        self.responses.append(response)
+        self.current = None
+        return response
+
+    def results(self):
+        """
+        Summary of the assessment so far.
+
+        Returns:
+            dict: ability, estimated level, score (% correct), and correct/asked per topic
+        """
+        topics = {}
+        for response in self.responses:
+            counts = topics.setdefault(response["topic"], {"correct": 0, "asked": 0})
+            counts["asked"] += 1
+            counts["correct"] += int(response["correct"])
+        correct = sum(int(response["correct"]) for response in self.responses)
+        return {
+            "ability": round(self.ability, 2),
+            "level": level_for_ability(self.ability),
+            "score": round(100 * correct / len(self.responses)) if self.responses else 0,
+            "answered": len(self.responses),
+            "topics": topics,
+        }
+
+    def _request_top_up(self, topic):
+        level = level_for_ability(self.ability)
+        key = (topic, level)
+        if key in self._top_ups:
+            return False
+        self._top_ups[key] = _top_up_executor.submit(top_up_bank, topic, level, self.user_info, self.bank)
+        return True
+
+    def _merge_top_ups(self):
+        for (topic, level), future in self._top_ups.items():
+            if future is None or not future.done():
+                continue
+            # Keep the key, so the same top-up isn't requested again
+            self._top_ups[(topic, level)] = None
+            if future.exception() is None:
+                for item in future.result():
+                    self.pool.add(topic, LEVEL_DIFFICULTY[level.lower()], item)
+
+def top_up_bank(topic, level, user_info, bank=None):
+    """
+    Generate questions for a topic at a level, storing them in the bank if there is one.
+
+    Returns:
+        list: The generated multiple-choice questions
+    """
+    from assessment_model import get_assessment_generator
+
+    generator = get_assessment_generator()
+    user_info = dict(user_info, experience_level=level)
+    assessment_text = generator.generate_assessment(f"- {topic}", user_info)
+    if assessment_text.startswith("Error generating assessment:"):
+        print(f' -- Topping up "{topic}" ({level}) failed: {assessment_text}')
+        return []
+    assessment = generator.complete_assessment(assessment_text, f"- {topic}", user_info)
+    if bank is not None:
+        bank.add_assessment(topic, level, assessment)
+    print(f' -- Topped up "{topic}" ({level}) with {len(assessment["multiple_choice"])} questions.')
+    return assessment["multiple_choice"]
+
+def start_adaptive_assessment(topics, user_info, fallback_assessment=None, max_items=None):
+    """
+    Start an adaptive assessment for the topics of a learning path.
+
+    Questions come from the assessment bank. Without a bank, the multiple-choice
+    questions of an already generated assessment are used, at the learner's level.
+
+    Args:
+        topics (list): Pathway names from the learner's course table
+        user_info (dict): User information
+        fallback_assessment (dict): A generated assessment (optional)
+        max_items (int): Questions to ask (default: ADAPTIVE_MAX_ITEMS)
+
+    Returns:
+        AdaptiveAssessment: The assessment session
+    """
+    bank = get_assessment_bank()
+    pool = ItemPool()
+    if bank is not None:
+        for item_id, topic, difficulty, item in bank.items_for(topics):
+            pool.add(topic, difficulty, item, item_id)
+    if fallback_assessment and not pool.topics():
+        level = normalize_value(user_info.get("experience_level", "Beginner"))
+        for index, item in enumerate(fallback_assessment.get("multiple_choice", [])):
+            # Without a bank the questions aren't tied to a topic; spread them over the path
+            topic = topics[index % len(topics)] if topics else "General"
+            pool.add(topic, LEVEL_DIFFICULTY.get(level, 0.0), item)
+    return AdaptiveAssessment(topics or pool.topics(), user_info, pool, max_items, bank)
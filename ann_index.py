@@ -0,0 +1,208 @@
+import os
+
+import faiss
+import numpy as np
+
+# Supported FAISS index types, from exact to most compressed
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# Below this many training vectors IVF/PQ quantisers are not worth training
+MIN_TRAINING_VECTORS = 1000
+
+class AnnIndexConfig:
+    """
+    Which FAISS index to build and how to search it.
+
+    Build parameters:
+        index_type: "flat" (exact), "ivf_flat", "hnsw" or "ivf_pq"
+        nlist: number of IVF lists (clusters)
+        hnsw_m: HNSW graph degree
+        ef_construction: HNSW build-time beam width
+        pq_m: number of PQ sub-quantisers (must divide the dimension)
+        pq_bits: bits per PQ code
+        training_size: maximum number of vectors used to train IVF/PQ
+
+    Search parameters:
+        nprobe: IVF lists visited per query
+        ef_search: HNSW search-time beam width
+    """
+
+    def __init__(self, index_type="flat", nlist=1024, nprobe=16, hnsw_m=32, ef_construction=200,
+                 ef_search=64, pq_m=16, pq_bits=8, training_size=100000):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.training_size = training_size
+
+    @classmethod
+    def from_env(cls):
+        """
+        Read the configuration from FAISS_* environment variables.
+        """
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+            nlist=int(os.getenv("FAISS_NLIST", "1024")),
+            nprobe=int(os.getenv("FAISS_NPROBE", "16")),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+            ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", "200")),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+            pq_m=int(os.getenv("FAISS_PQ_M", "16")),
+            pq_bits=int(os.getenv("FAISS_PQ_BITS", "8")),
+            training_size=int(os.getenv("FAISS_TRAINING_SIZE", "100000")),
+        )
+
+    def build_params(self):
+        """
+        Parameters that change the index contents; recorded in the index manifest.
+        """
+        params = {"index_type": self.index_type}
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            params["nlist"] = self.nlist
+        if self.index_type == "hnsw":
+            params.update(hnsw_m=self.hnsw_m, ef_construction=self.ef_construction)
+        if self.index_type == "ivf_pq":
+            params.update(pq_m=self.pq_m, pq_bits=self.pq_bits)
+        return params
+
+    def needs_training(self):
+        return self.index_type in ("ivf_flat", "ivf_pq")
+
+def create_index(config, training_vectors):
+    """
+    Create and, if needed, train an empty FAISS index.
+
+    Args:
+        config (AnnIndexConfig): The index configuration
+        training_vectors (np.ndarray): Sample of the vectors to be indexed (float32, n x d)
+
+    Returns:
+        faiss.Index: An index ready for add()
+    """
+    dimensions = training_vectors.shape[1]
+    index_type = config.index_type
+    if config.needs_training() and len(training_vectors) < MIN_TRAINING_VECTORS:
+        print(f' -- Only {len(training_vectors)} vectors, too few to train "{index_type}"; using an exact flat index.')
+        index_type = "flat"
+
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimensions)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimensions, config.hnsw_m)
+        index.hnsw.efConstruction = config.ef_construction
+        index.hnsw.efSearch = config.ef_search
+        return index
+
+    # Keep roughly 39+ training points per list, as FAISS recommends
+    nlist = max(1, min(config.nlist, len(training_vectors) // 39))
+    quantizer = faiss.IndexFlatL2(dimensions)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimensions, nlist, faiss.METRIC_L2)
+    else:
+        if dimensions % config.pq_m:
+            raise ValueError(f"FAISS_PQ_M ({config.pq_m}) must divide the embedding dimension ({dimensions})")
+        index = faiss.IndexIVFPQ(quantizer, dimensions, nlist, config.pq_m, config.pq_bits)
+    print(f' -- Training "{index_type}" index ({nlist} lists) on {len(training_vectors)} vectors.')
+    index.train(training_vectors)
+    index.nprobe = config.nprobe
+    return index
+
+def index_type_of(index):
+    """
+    The INDEX_TYPES name of a FAISS index, e.g. "flat" for the fallback built
+    when there were too few vectors to train the configured type.
+    """
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+    return "flat"
+
+def needs_upgrade(index, config, vector_count):
+    """
+    Whether an index built as a fallback should be rebuilt as the configured type.
+
+    create_index builds a flat index while there are fewer than
+    MIN_TRAINING_VECTORS vectors; incremental updates would otherwise keep
+    adding to it after the catalog has grown past the threshold.
+
+    Args:
+        index (faiss.Index): The index on disk
+        config (AnnIndexConfig): The index configuration
+        vector_count (int): Number of vectors the updated index will hold
+    """
+    return index_type_of(index) != config.index_type and vector_count >= MIN_TRAINING_VECTORS
+
+def configure_search(index, config):
+    """
+    Apply the search-time knobs (nprobe, efSearch) to a loaded index.
+    """
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        ivf_index.nprobe = config.nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = config.ef_search
+    return index
+
+def search_candidates(index, vectors, k, candidate_positions, config):
+    """
+    Search only among the given FAISS positions (e.g. pre-filtered courses).
+
+    Non-candidates are skipped by an IDSelector inside FAISS, so they are never
+    scored. If an approximate index returns fewer than k hits because the
+    candidates are spread thinly, the search is repeated exhaustively.
+
+    Args:
+        index (faiss.Index): The index to search
+        vectors (np.ndarray): Query vectors (float32, n x d)
+        k (int): Number of neighbours per query
+        candidate_positions (np.ndarray): Allowed positions (int64)
+        config (AnnIndexConfig): Search-time knobs
+
+    Returns:
+        tuple: (distances, positions) as returned by index.search
+    """
+    selector = faiss.IDSelectorBatch(len(candidate_positions), faiss.swig_ptr(candidate_positions))
+    k = min(k, len(candidate_positions))
+    ivf_index = faiss.try_extract_index_ivf(index)
+
+    def run(exhaustive):
+        if ivf_index is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf_index.nlist if exhaustive else config.nprobe)
+        elif hasattr(index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(config.ef_search, 1024 if exhaustive else k))
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        return index.search(vectors, k, params=params)
+
+    distances, positions = run(exhaustive=False)
+    if (positions == -1).any() and (ivf_index is not None or hasattr(index, "hnsw")):
+        distances, positions = run(exhaustive=True)
+    return distances, positions
+
+def supports_positional_removal(index):
+    """
+    Whether removing vectors keeps FAISS ids equal to their positions.
+
+    Flat indexes renumber the remaining vectors after remove_ids, which is what
+    the LangChain FAISS wrapper expects. IVF indexes keep the old ids and HNSW
+    cannot remove at all, so for those a deletion means a full rebuild.
+    """
+    return isinstance(index, faiss.IndexFlat)
+
+def index_memory_bytes(index):
+    """
+    Size of the serialised index, a close estimate of its memory footprint.
+    """
+    return int(faiss.serialize_index(index).nbytes)
+
+def as_float32_matrix(vectors):
+    return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
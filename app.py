@@ -1,5 +1,6 @@
-from flask import Flask, request, jsonify
-from recommendation_model import generate_learning_path  # Import your recommendation model
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
+from recommendation_model import generate_learning_path, generate_learning_paths, get_engine, reload_engine, stream_learning_path  # Import your recommendation model
 
 app = Flask(__name__)
 
@@ -16,5 +17,48 @@ def recommend():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    # Accepts {"items": [...]} where each item is a query string, {"query": ...} or a learner profile
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty list of items is required"}), 400
+
+    try:
+        return jsonify({"results": generate_learning_paths(items)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recommend/stream', methods=['POST'])
+def recommend_stream():
+    # Server-sent events: one "data:" message per text chunk, then a "done" event
+    data = request.json
+    user_input = data.get('query')
+    if not user_input:
+        return jsonify({"error": "Query is required"}), 400
+
+    def events():
+        for chunk in stream_learning_path(user_input):
+            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/reload', methods=['POST'])
+def reload():
+    # Pick up changes to the learning path CSV without restarting the process
+    try:
+        loaded_at = reload_engine().loaded_at
+        return jsonify({"status": "reloaded", "loaded_at": loaded_at.isoformat()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
+    # Warm the shared engine once so the first request doesn't pay the load cost
+    get_engine()
     app.run(debug=True)
\ No newline at end of file
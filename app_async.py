@@ -0,0 +1,114 @@
+import asyncio
+import json
+from quart import Quart, Response, request, jsonify
+from recommendation_model import generate_learning_paths, get_engine, reload_engine
+from assessment_model import agenerate_assessment, assessment_request_key, get_assessment_generator
+from singleflight import AsyncSingleFlight
+
+# Asyncio-native counterpart of app.py. Run it with an ASGI server, e.g.:
+#   hypercorn app_async:app --bind 0.0.0.0:8000
+# LLM and embedding calls are awaited and FAISS searches run in an executor, so a
+# single process can hold many in-flight requests without a thread per request.
+
+app = Quart(__name__)
+
+# Concurrent identical assessment requests share one LLM call
+_assessment_flights = AsyncSingleFlight()
+
+@app.before_serving
+async def warm_up():
+    # Load the shared index and LLM clients before accepting requests
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, get_engine)
+    await loop.run_in_executor(None, get_assessment_generator)
+
+@app.route('/recommend', methods=['POST'])
+async def recommend():
+    data = await request.get_json()
+    user_input = data.get('query')
+    if not user_input:
+        return jsonify({"error": "Query is required"}), 400
+
+    try:
+        learning_path = await get_engine().aget_response_for(user_input)
+        return jsonify({"learning_path": learning_path})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recommend/batch', methods=['POST'])
+async def recommend_batch():
+    data = await request.get_json()
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty list of items is required"}), 400
+
+    try:
+        # The batch path fans out on its own bounded thread pool
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(None, generate_learning_paths, items)
+        return jsonify({"results": results})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recommend/stream', methods=['POST'])
+async def recommend_stream():
+    # Server-sent events: one "data:" message per text chunk, then a "done" event
+    data = await request.get_json()
+    user_input = data.get('query')
+    if not user_input:
+        return jsonify({"error": "Query is required"}), 400
+
+    async def events():
+        async for chunk in get_engine().astream_response_for(user_input):
+            yield f"data: {json.dumps({'chunk': chunk})}\n\n".encode()
+        yield b"event: done\ndata: {}\n\n"
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None
+    return response
+
+@app.route('/assessment', methods=['POST'])
+async def assessment():
+    data = await request.get_json()
+    learning_path = data.get('learning_path')
+    if not learning_path:
+        return jsonify({"error": "learning_path is required"}), 400
+
+    try:
+        user_info = data.get('user_info') or {}
+        assessment_text = await _assessment_flights.do(
+            assessment_request_key(learning_path, user_info),
+            agenerate_assessment, learning_path, user_info
+        )
+        return jsonify({"assessment": assessment_text})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/evaluate', methods=['POST'])
+async def evaluate():
+    data = await request.get_json()
+    if not data.get('assessment') or not data.get('user_answers'):
+        return jsonify({"error": "assessment and user_answers are required"}), 400
+
+    try:
+        evaluation = await get_assessment_generator().aevaluate_user_answers(
+            data['assessment'], data['user_answers']
+        )
+        return jsonify({"evaluation": evaluation})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/reload', methods=['POST'])
+async def reload():
+    # Rebuilding the index is blocking work; keep it off the event loop
+    try:
+        loop = asyncio.get_running_loop()
+        engine = await loop.run_in_executor(None, reload_engine)
+        return jsonify({"status": "reloaded", "loaded_at": engine.loaded_at.isoformat()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+if __name__ == '__main__':
+    app.run()
\ No newline at end of file
@@ -1,62 +1,93 @@
 import streamlit as st
 import pandas as pd
-import json
 import os
-import re
-from datetime import datetime
-from recommendation_model import generate_learning_path, GenerateLearningPathIndexEmbeddings
-from assessment_model import generate_assessment  # Import the new assessment model
+from recommendation_model import (
+    format_profile_query, get_engine, split_recommendation, stream_learning_path_parts, watch_engine
+)
+from assessment_model import complete_assessment, extract_course_rows, prefetch_assessment, stream_assessment  # Import the new assessment model
+from adaptive_assessment import start_adaptive_assessment
+from session_store import SESSION_FIELDS, get_session_store
 
-# Function to check and update the FAISS index
-def update_faiss_index(csv_filename):
-    faiss_vectorstore_foldername = "faiss_learning_path_index"
-    csv_last_modified = datetime.fromtimestamp(os.path.getmtime(csv_filename))
-    index_last_modified = None
-    if os.path.exists(faiss_vectorstore_foldername):
-        index_last_modified = datetime.fromtimestamp(os.path.getmtime(faiss_vectorstore_foldername))
-    if not os.path.exists(faiss_vectorstore_foldername) or csv_last_modified > index_last_modified:
-        print(' -- Creating a new FAISS vector store from chunked text and Gemini embeddings.')
-        GenerateLearningPathIndexEmbeddings(csv_filename)
-        print(f' -- Saved the newly created FAISS vector store at "{faiss_vectorstore_foldername}".')
-    else:
-        print(f' -- Found existing FAISS vector store at "{faiss_vectorstore_foldername}", loading from cache.')
+# Generate the assessment in the background as soon as the course table is ready.
+# Off by default: it costs a full assessment LLM call per learning path, even if
+# the learner never opens the Assessment tab.
+PREFETCH_ASSESSMENT = os.getenv("PREFETCH_ASSESSMENT", "false").lower() in ("1", "true", "yes")
+
+# Load the recommendation engine once per process and share it across sessions and reruns.
+# A background watcher rebuilds the index when the CSV changes and swaps it in when ready.
+@st.cache_resource(show_spinner="Loading the learning path index...")
+def load_engine(csv_filename):
+    watch_engine(csv_filename)
+    return get_engine(csv_filename)
+
+# Function to render a streamed LLM response as it arrives and return the full text
+def render_stream(chunks, placeholder, language=None):
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        if language:
+            placeholder.code(text, language=language)
+        else:
+            placeholder.markdown(text)
+    placeholder.empty()
+    return text
 
 # Function to split response into introduction and table
 def process_recommendation(recommendation_text):
-    # Look for the table marker
-    table_pattern = r'\|\s*Learning Pathway\s*\|\s*duration\s*\|\s*link\s*\|\s*Module\s*\|'
-    
-    # Check if the pattern exists in the text
-    if re.search(table_pattern, recommendation_text):
-        # Split the text at the table marker
-        parts = re.split(table_pattern, recommendation_text, 1)
-        
-        path_introduction = parts[0].strip()
-        path_content = '| Learning Pathway | duration | link | Module |\n' + parts[1].strip()
-        
-        return path_introduction, path_content
-    else:
-        # If table format isn't found, return the whole text as introduction
-        return recommendation_text, ""
+    return split_recommendation(recommendation_text)
 
-# Function to parse JSON assessment response
-def process_assessment(assessment_text):
-    # Try to extract JSON if it's embedded in markdown or text
-    json_pattern = r'```json\s*([\s\S]*?)\s*```'
-    json_match = re.search(json_pattern, assessment_text)
-    
-    if json_match:
-        try:
-            return json.loads(json_match.group(1))
-        except:
-            pass
-    
-    # Try to directly parse as JSON
+# Function to generate the learning path, streaming the introduction and showing the course table once it is ready
+def generate_recommendation(query, user_info):
+    introduction_placeholder, table_placeholder = st.empty(), st.empty()
+    path_introduction, path_content = "", ""
+    st.session_state.assessment_prefetch = None
+    for path_introduction, path_content in stream_learning_path_parts(query):
+        introduction_placeholder.markdown(path_introduction)
+        if path_content:
+            table_placeholder.markdown(path_content, unsafe_allow_html=True)
+            # Prefetch the assessment for the course table while the introduction is still streaming
+            if PREFETCH_ASSESSMENT and st.session_state.assessment_prefetch is None:
+                st.session_state.assessment_prefetch = (path_content, prefetch_assessment(path_content, user_info))
+    introduction_placeholder.empty()
+    table_placeholder.empty()
+    return path_introduction, path_content
+
+# Function to check that a learning path was generated successfully (failures are returned as text)
+def is_complete_path(path_introduction, path_content):
+    return bool(path_content) and not (path_introduction or "").startswith("Error")
+
+# Function to persist the current session, so a refresh or another replica can resume it
+def save_session(**fields):
+    user_info = st.session_state.get("user_info") or {}
+    if not user_info.get("email"):
+        return
+    # A failed generation must not be saved, or resuming would replay the error
+    if "path_content" in fields and not is_complete_path(fields.get("path_introduction"), fields["path_content"]):
+        return
+    # The code is shown to the learner and needed, with the email, to resume
+    if not st.session_state.get("resume_code"):
+        st.session_state.resume_code = get_session_store().new_resume_code()
     try:
-        return json.loads(assessment_text)
-    except:
-        # If not valid JSON, return the raw text
+        get_session_store().save(user_info["email"], st.session_state.resume_code, user_info=user_info, **fields)
+    except Exception as e:
+        print(f' -- Saving the session failed: {e}')
+
+# Function to restore a saved session into st.session_state
+def resume_session(session):
+    for field in SESSION_FIELDS:
+        if field in session:
+            st.session_state[field] = session[field]
+    st.session_state.show_regenerate = bool(session.get("path_introduction"))
+    st.session_state.show_assessment = bool(session.get("assessment_data"))
+
+# Function to parse JSON assessment response
+def process_assessment(assessment_text, learning_path_data, user_info):
+    # Repair truncated JSON and re-request only the sections that came back broken
+    assessment = complete_assessment(assessment_text, learning_path_data, user_info)
+    if assessment is None:
+        # If there is no usable assessment, return the raw text
         return {"raw_text": assessment_text}
+    return assessment
 
 # Set the title of the app with improved styling
 st.set_page_config(page_title="Learning Path Assistant", layout="wide")
@@ -264,8 +295,8 @@ st.markdown('<div class="info-box">To get started, please provide some informati
 # Define the CSV file path
 csv_filename = "one.csv"
 
-# Update the FAISS index if necessary
-update_faiss_index(csv_filename)
+# Load the shared engine (only the first run of the process waits for it)
+load_engine(csv_filename)
 
 # Initialize session state variables if they don't exist
 if 'show_regenerate' not in st.session_state:
@@ -277,6 +308,21 @@ if 'show_assessment' not in st.session_state:
 tab1, tab2, tab3 = st.tabs(["Your Information", "View Learning Path", "Assessment"])
 
 with tab1:
+    # Let returning learners pick up their saved learning path and assessment
+    with st.expander("Returning? Resume your saved learning path"):
+        with st.form("resume_form"):
+            resume_email = st.text_input("Email Address", key="resume_email")
+            resume_code = st.text_input("Resume Code", key="resume_code_input", type="password")
+            resume_submitted = st.form_submit_button("Resume")
+        if resume_submitted and resume_email and resume_code:
+            session = get_session_store().load(resume_email, resume_code)
+            if session and is_complete_path(session.get("path_introduction"), session.get("path_content")):
+                resume_session(session)
+                st.session_state.resume_code = resume_code.strip()
+                st.success("Welcome back! Your learning path is in the 'View Learning Path' tab.")
+            else:
+                st.warning("No saved learning path was found for this email address and resume code.")
+    
     st.markdown('<div class="sub-header">Personal Information</div>', unsafe_allow_html=True)
     
     with st.form("user_info_form"):
@@ -318,7 +364,12 @@ with tab1:
         
         # Format the query to include all relevant information
         def format_query():
-            return f"Generate a learning path for {learning_category} for a {experience_level.lower()} with {available_time} hours per week available. Goals: {goals}"
+            return format_profile_query({
+                "learning_category": learning_category,
+                "experience_level": experience_level,
+                "available_time": available_time,
+                "goals": goals
+            })
         
         # Add a submit button
         submitted = st.form_submit_button("Generate Learning Path")
@@ -340,17 +391,32 @@ with tab1:
                     "query": format_query()
                 }
                 
-                # Generate recommendations and store in session state
-                with st.spinner("Generating your personalized learning path..."):
-                    recommendations = generate_learning_path(format_query())
-                    path_introduction, path_content = process_recommendation(recommendations)
+                # Reuse this learner's saved learning path for an unchanged profile instead of generating it again
+                resume_code = st.session_state.get("resume_code")
+                saved = get_session_store().load(email, resume_code) if resume_code else None
+                if (saved and is_complete_path(saved.get("path_introduction"), saved.get("path_content"))
+                        and saved.get("user_info", {}).get("query") == format_query()):
+                    user_info = st.session_state.user_info
+                    resume_session(saved)
+                    st.session_state.user_info = user_info
+                else:
+                    # Generate recommendations, showing them as they stream in, and store them in session state
+                    st.caption("Generating your personalized learning path...")
+                    path_introduction, path_content = generate_recommendation(format_query(), st.session_state.user_info)
                     
                     st.session_state.path_introduction = path_introduction
                     st.session_state.path_content = path_content
                     st.session_state.show_regenerate = True
+                    st.session_state.show_assessment = False
+                    save_session(
+                        path_introduction=path_introduction, path_content=path_content,
+                        assessment_text=None, assessment_data=None
+                    )
                 
                 # Show a success message and instruct to go to the next tab
                 st.success("Your learning path has been generated successfully! Please go to the 'View Learning Path' tab to see your results.")
+                if st.session_state.get("resume_code"):
+                    st.info(f"Your resume code is `{st.session_state.resume_code}`. Keep it with your email address to resume this learning path later.")
 
 with tab2:
     st.markdown('<div class="sub-header">Your Personalized Learning Path</div>', unsafe_allow_html=True)
@@ -409,21 +475,23 @@ with tab2:
                         original_query = st.session_state.user_info["query"]
                         updated_query = f"{original_query} Additional requirements: {updated_requirements}"
                         
-                        # Generate new recommendations
-                        with st.spinner("Regenerating your personalized learning path..."):
-                            new_recommendations = generate_learning_path(updated_query)
-                            new_path_introduction, new_path_content = process_recommendation(new_recommendations)
-                            
-                            # Update session state
-                            st.session_state.path_introduction = new_path_introduction
-                            st.session_state.path_content = new_path_content
-                            st.session_state.regenerate_expanded = False
-                            
-                            # Store the updated query
-                            st.session_state.user_info["query"] = updated_query
-                            
-                            st.success("Your learning path has been updated successfully!")
-                            st.experimental_rerun()
+                        # Generate new recommendations, showing them as they stream in
+                        st.caption("Regenerating your personalized learning path...")
+                        new_path_introduction, new_path_content = generate_recommendation(
+                            updated_query, st.session_state.user_info
+                        )
+                        
+                        # Update session state
+                        st.session_state.path_introduction = new_path_introduction
+                        st.session_state.path_content = new_path_content
+                        st.session_state.regenerate_expanded = False
+                        
+                        # Store the updated query
+                        st.session_state.user_info["query"] = updated_query
+                        save_session(path_introduction=new_path_introduction, path_content=new_path_content)
+                        
+                        st.success("Your learning path has been updated successfully!")
+                        st.rerun()
             
             st.markdown('</div>', unsafe_allow_html=True)
             
@@ -440,13 +508,32 @@ with tab2:
                 if st.session_state.path_content:
                     learning_path_data += "\n\n" + st.session_state.path_content
                 
-                # Generate the assessment
-                with st.spinner("Creating your personalized assessment..."):
-                    assessment_text = generate_assessment(learning_path_data, st.session_state.user_info)
-                    st.session_state.assessment_text = assessment_text
-                    
-                    # Try to parse as JSON if possible
-                    st.session_state.assessment_data = process_assessment(assessment_text)
+                # Use the assessment prefetched for this course table if it was generated successfully
+                assessment_text = None
+                prefetch = st.session_state.get("assessment_prefetch")
+                if prefetch and prefetch[0] == st.session_state.path_content:
+                    with st.spinner("Creating your personalized assessment..."):
+                        assessment_text = prefetch[1].result()
+                    if assessment_text.startswith("Error generating assessment:"):
+                        assessment_text = None
+                        st.session_state.assessment_prefetch = None
+
+                if assessment_text is None:
+                    # Generate the assessment, showing the raw output as it streams in
+                    st.caption("Creating your personalized assessment...")
+                    assessment_text = render_stream(
+                        stream_assessment(learning_path_data, st.session_state.user_info),
+                        st.empty(),
+                        language="json"
+                    )
+                st.session_state.assessment_text = assessment_text
+                
+                # Parse the assessment, filling in any section that came back incomplete
+                with st.spinner("Checking your assessment..."):
+                    st.session_state.assessment_data = process_assessment(
+                        assessment_text, learning_path_data, st.session_state.user_info
+                    )
+                save_session(assessment_text=assessment_text, assessment_data=st.session_state.assessment_data)
                 
                 st.success("Your assessment has been created! Please go to the 'Assessment' tab to view it.")
             
@@ -542,29 +629,29 @@ with tab3:
                     st.markdown(f'<div class="question">', unsafe_allow_html=True)
                     st.markdown(f"**Question {i+1}:** {q['question']}")
                     
-                    if "guidance" in q:
-                        st.markdown("*Guidance:* {q['guidance']}")
+                    if q.get("guidance"):
+                        st.markdown(f"*Guidance:* {q['guidance']}")
                     
                     st.markdown('</div>', unsafe_allow_html=True)
                 
                 st.markdown('</div>', unsafe_allow_html=True)
             
             # Display Practical Exercises
-            if "practical_exercises" in assessment_data:
+            if "practical_exercise" in assessment_data:
                 st.markdown('<div class="assessment-section">', unsafe_allow_html=True)
                 st.markdown("### Practical Exercises")
                 
-                for i, exercise in enumerate(assessment_data["practical_exercises"]):
+                for i, exercise in enumerate(assessment_data["practical_exercise"]):
                     st.markdown(f'<div class="question">', unsafe_allow_html=True)
                     st.markdown(f"**Exercise {i+1}:** {exercise['title']}")
                     st.markdown(f"{exercise['description']}")
                     
-                    if "steps" in exercise:
+                    if exercise.get("steps"):
                         st.markdown("**Steps:**")
                         for j, step in enumerate(exercise['steps']):
                             st.markdown(f"{j+1}. {step}")
                     
-                    if "criteria" in exercise:
+                    if exercise.get("criteria"):
                         st.markdown("**Success Criteria:**")
                         for criterion in exercise['criteria']:
                             st.markdown(f"- {criterion}")
@@ -576,16 +663,73 @@ with tab3:
         # Display the assessment
         display_assessment()
         
-        # Add option to take the assessment interactively (placeholder)
+        # Add option to take the assessment interactively, adapting difficulty to the answers
         st.markdown('<div class="save-options">', unsafe_allow_html=True)
         col1, col2 = st.columns(2)
         with col1:
             if st.button("📝 Take Assessment Interactively", key="take_assessment", help="Take the assessment with immediate feedback"):
-                st.info("Interactive assessment functionality would be implemented here.")
+                topics = [pathway for pathway, _ in extract_course_rows(st.session_state.path_content or "")]
+                st.session_state.adaptive_assessment = start_adaptive_assessment(
+                    topics, st.session_state.user_info, st.session_state.assessment_data
+                )
+                st.session_state.adaptive_feedback = None
         with col2:
             if st.button("💾 Save Assessment for Later", key="save_assessment", help="Save this assessment to your profile"):
-                st.info("Assessment saved successfully!")
+                save_session(
+                    path_introduction=st.session_state.path_introduction,
+                    path_content=st.session_state.path_content,
+                    assessment_text=st.session_state.get("assessment_text"),
+                    assessment_data=st.session_state.assessment_data
+                )
+                st.info(
+                    f"Assessment saved! Resume it any time with {st.session_state.user_info['email']} "
+                    f"and your resume code `{st.session_state.get('resume_code')}`."
+                )
         st.markdown('</div>', unsafe_allow_html=True)
+        
+        # Interactive assessment: one question at a time, chosen for the learner's current ability
+        adaptive = st.session_state.get("adaptive_assessment")
+        if adaptive is not None:
+            st.markdown('<div class="assessment-section">', unsafe_allow_html=True)
+            st.markdown("### Interactive Assessment")
+            
+            feedback = st.session_state.get("adaptive_feedback")
+            if feedback:
+                if feedback["correct"]:
+                    st.success("Correct!")
+                else:
+                    st.error(f"Not quite. The correct answer is: {feedback['correct_answer']}")
+            
+            entry = adaptive.next_item()
+            if entry is None and adaptive.pending:
+                # More questions are being generated; a click reruns the script and asks again
+                st.info("Preparing more questions for your level...")
+                st.button("Continue", key="adaptive_continue")
+            elif entry is None:
+                results = adaptive.results()
+                if results["answered"]:
+                    st.markdown(f"**Score:** {results['score']}% ({results['answered']} questions)")
+                    st.markdown(f"**Estimated level:** {results['level']}")
+                    for topic, counts in results["topics"].items():
+                        st.markdown(f"- {topic}: {counts['correct']}/{counts['asked']} correct")
+                else:
+                    st.info("There are no multiple-choice questions for this learning path yet. Please try again shortly.")
+            else:
+                item = entry["item"]
+                st.markdown(f"**Question {len(adaptive.responses) + 1} of {adaptive.max_items}:** {item['question']}")
+                with st.form(f"adaptive_question_{len(adaptive.responses)}"):
+                    choice = st.radio(
+                        "Your answer",
+                        range(len(item["options"])),
+                        format_func=lambda index: f"{chr(65 + index)}. {item['options'][index]}",
+                        index=None
+                    )
+                    submitted = st.form_submit_button("Submit Answer")
+                if submitted and choice is not None:
+                    st.session_state.adaptive_feedback = adaptive.answer(choice)
+                    st.rerun()
+            
+            st.markdown('</div>', unsafe_allow_html=True)
     else:
         st.info("No assessment created yet. Please go to the 'View Learning Path' tab and click on 'Create Assessment'.")
 
@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from assessment_schema import SECTION_COUNTS, parse_assessment, validate_assessment
+from course_filters import normalize_value
+
+# Pre-generated assessment questions for every catalog pathway and experience level, e.g.:
+#   python assessment_bank.py --csv one.csv --rounds 2
+# At request time an assessment is assembled by sampling questions for the
+# pathways in the learner's table, which takes milliseconds instead of a long
+# LLM completion. The LLM only writes questions for pathways the bank lacks.
+
+EXPERIENCE_LEVELS = ("Beginner", "Intermediate", "Advanced", "Expert")
+
+# Starting difficulty of a question on the Rasch (logit) scale, by the level it was
+# written for; adaptive assessments recalibrate it from learners' answers
+LEVEL_DIFFICULTY = {
+    "beginner": -1.5,
+    "intermediate": -0.5,
+    "advanced": 0.5,
+    "expert": 1.5,
+}
+
+DEFAULT_BANK_PATH = "assessment_bank.sqlite"
+
+def assessment_sections(assessment):
+    """
+    Yield (section, item) for every valid question of a parsed assessment.
+    """
+    assessment, _ = validate_assessment(assessment)
+    for section, items in assessment.items():
+        for item in items:
+            yield section, item
+
+class AssessmentBank:
+    """
+    SQLite store of assessment questions indexed by (pathway, level, section).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("ASSESSMENT_BANK_PATH", DEFAULT_BANK_PATH)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def connection(self):
+        # SQLite connections can't be shared between threads, so each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                " id INTEGER PRIMARY KEY, pathway TEXT NOT NULL, level TEXT NOT NULL,"
+                " section TEXT NOT NULL, content TEXT NOT NULL, difficulty REAL)"
+            )
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(items)")}
+            if "difficulty" not in columns:
+                # Banks built before adaptive assessments: start every question at its level's difficulty.
+                # Another thread may be migrating too, in which case the column already exists.
+                try:
+                    connection.execute("ALTER TABLE items ADD COLUMN difficulty REAL")
+                    connection.executemany(
+                        "UPDATE items SET difficulty = ? WHERE level = ?",
+                        [(difficulty, level) for level, difficulty in LEVEL_DIFFICULTY.items()]
+                    )
+                    connection.commit()
+                except sqlite3.OperationalError:
+                    connection.rollback()
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS items_lookup ON items (pathway, level, section)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def add_assessment(self, pathway, level, assessment):
+        """
+        Store the questions of a parsed assessment for a pathway and level.
+
+        Returns:
+            int: Number of questions stored
+        """
+        return self.add_assessments(pathway, level, [assessment])
+
+    def add_assessments(self, pathway, level, assessments, replace=False):
+        """
+        Store the questions of several parsed assessments for a pathway and level.
+
+        Args:
+            pathway (str): Pathway name
+            level (str): Experience level
+            assessments (list): Parsed assessments
+            replace (bool): Delete the pathway and level's existing questions in the
+                same transaction, so they are only dropped once their replacement is stored
+
+        Returns:
+            int: Number of questions stored
+        """
+        difficulty = LEVEL_DIFFICULTY.get(normalize_value(level), 0.0)
+        rows = [
+            (normalize_value(pathway), normalize_value(level), section, json.dumps(item), difficulty)
+            for assessment in assessments
+            for section, item in assessment_sections(assessment)
+        ]
+        with self._write_lock:
+            connection = self.connection()
+            if replace:
+                connection.execute(
+                    "DELETE FROM items WHERE pathway = ? AND level = ?",
+                    (normalize_value(pathway), normalize_value(level))
+                )
+            connection.executemany(
+                "INSERT INTO items (pathway, level, section, content, difficulty) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            connection.commit()
+        return len(rows)
+
+    def delete(self, pathway, level):
+        with self._write_lock:
+            connection = self.connection()
+            connection.execute(
+                "DELETE FROM items WHERE pathway = ? AND level = ?",
+                (normalize_value(pathway), normalize_value(level))
+            )
+            connection.commit()
+
+    def covered_pathways(self, pathways, level):
+        """
+        The pathways that have questions for a level.
+        """
+        keys = {normalize_value(pathway): pathway for pathway in pathways}
+        if not keys or not self.exists():
+            return []
+        placeholders = ",".join("?" * len(keys))
+        rows = self.connection().execute(
+            f"SELECT DISTINCT pathway FROM items WHERE level = ? AND pathway IN ({placeholders})",
+            [normalize_value(level), *keys]
+        ).fetchall()
+        found = {pathway for (pathway,) in rows}
+        return [pathway for key, pathway in keys.items() if key in found]
+
+    def items_for(self, pathways, section="multiple_choice"):
+        """
+        Every question of a section for the pathways, at all levels.
+
+        Returns:
+            list: (id, pathway, difficulty, item) tuples, with the pathway as given
+        """
+        keys = {normalize_value(pathway): pathway for pathway in pathways}
+        if not keys or not self.exists():
+            return []
+        placeholders = ",".join("?" * len(keys))
+        rows = self.connection().execute(
+            f"SELECT id, pathway, difficulty, content FROM items WHERE section = ? AND pathway IN ({placeholders})",
+            [section, *keys]
+        ).fetchall()
+        return [(item_id, keys[pathway], difficulty, json.loads(content)) for item_id, pathway, difficulty, content in rows]
+
+    def adjust_difficulties(self, adjustments):
+        """
+        Recalibrate question difficulties by the given amounts.
+
+        The change is applied in SQL, so updates from learners answering at the
+        same time add up instead of overwriting each other.
+
+        Args:
+            adjustments (dict): Item id -> change in difficulty
+        """
+        if not adjustments:
+            return
+        with self._write_lock:
+            connection = self.connection()
+            connection.executemany(
+                "UPDATE items SET difficulty = difficulty + ? WHERE id = ?",
+                [(adjustment, item_id) for item_id, adjustment in adjustments.items()]
+            )
+            connection.commit()
+
+    def sample(self, pathways, level, extra_items=None, rng=None):
+        """
+        Assemble an assessment from the bank.
+
+        Questions are drawn round-robin across the pathways, so the assessment
+        covers the whole learning path rather than its first course.
+
+        Args:
+            pathways (list): Pathway names from the learner's table
+            level (str): Experience level
+            extra_items (dict): Section -> questions from another source (e.g. the
+                LLM, for pathways missing from the bank), mixed in as one more pathway
+            rng (random.Random): Random generator (optional)
+
+        Returns:
+            dict: The assessment, with the keys of SECTION_COUNTS
+        """
+        rng = rng or random.Random()
+        pools = {section: [] for section in SECTION_COUNTS}
+        keys = list(dict.fromkeys(normalize_value(pathway) for pathway in pathways))
+        if keys and self.exists():
+            placeholders = ",".join("?" * len(keys))
+            rows = self.connection().execute(
+                f"SELECT pathway, section, content FROM items WHERE level = ? AND pathway IN ({placeholders})",
+                [normalize_value(level), *keys]
+            ).fetchall()
+            by_pathway = {}
+            for pathway, section, content in rows:
+                by_pathway.setdefault((section, pathway), []).append(json.loads(content))
+            for section in SECTION_COUNTS:
+                pools[section] = [by_pathway.get((section, key), []) for key in keys]
+        for section, items in (extra_items or {}).items():
+            if section in pools:
+                pools[section].append(list(items))
+
+        assessment = {}
+        for section, count in SECTION_COUNTS.items():
+            for items in pools[section]:
+                rng.shuffle(items)
+            chosen, seen = [], set()
+            while len(chosen) < count and any(pools[section]):
+                for items in pools[section]:
+                    if not items or len(chosen) >= count:
+                        continue
+                    item = items.pop()
+                    key = json.dumps(item, sort_keys=True)
+                    if key not in seen:
+                        seen.add(key)
+                        chosen.append(item)
+            assessment[section] = chosen
+        return assessment
+
+_bank = None
+_bank_lock = threading.Lock()
+
+def get_assessment_bank():
+    """
+    Return the process-wide assessment bank, or None if it hasn't been built.
+    """
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            _bank = AssessmentBank()
+    return _bank if _bank.exists() else None
+
+def build_bank(csv_filename="one.csv", levels=EXPERIENCE_LEVELS, rounds=1, concurrency=4, rebuild=False, bank=None):
+    """
+    Generate questions for every pathway in the catalog CSV and experience level.
+
+    Args:
+        csv_filename (str): The learning path CSV file
+        levels (tuple): Experience levels to generate for
+        rounds (int): Assessments generated per pathway and level; more rounds
+            give more variety when sampling
+        concurrency (int): Maximum concurrent LLM calls
+        rebuild (bool): Regenerate pathways that already have questions
+        bank (AssessmentBank): The bank to fill (default: ASSESSMENT_BANK_PATH)
+
+    Returns:
+        int: Number of questions stored
+    """
+    from assessment_model import get_assessment_generator
+    from recommendation_model import iter_csv_documents
+
+    bank = bank or AssessmentBank()
+    courses = {}
+    for document in iter_csv_documents(csv_filename):
+        pathway = document.metadata.get("learning_pathway")
+        if pathway:
+            courses.setdefault(pathway, document.metadata)
+
+    groups = []
+    for level in levels:
+        existing = set() if rebuild else set(bank.covered_pathways(courses, level))
+        groups.extend((pathway, metadata, level) for pathway, metadata in courses.items() if pathway not in existing)
+    print(f' -- Generating {len(groups) * rounds} assessments for {len(courses)} pathways and {len(levels)} levels.')
+
+    generator = get_assessment_generator()
+
+    def generate(pathway, metadata, level):
+        module = metadata.get("module")
+        topics = f"- {pathway} ({module})" if module else f"- {pathway}"
+        user_info = {
+            "experience_level": level,
+            "learning_category": metadata.get("domain", "General"),
+            "goals": f"Master {pathway}",
+        }
+        try:
+            assessment_text = generator.generate_assessment(topics, user_info)
+        except Exception as e:
+            print(f' -- Skipping "{pathway}" ({level}): {str(e)}')
+            return None
+        if parse_assessment(assessment_text) is None:
+            print(f' -- Skipping "{pathway}" ({level}): the model did not return JSON.')
+            return None
+        # Re-request any section the model cut short, so every stored assessment is complete
+        return generator.complete_assessment(assessment_text, topics, user_info)
+
+    def store(pathway, level, futures):
+        # With rebuild, the old questions are replaced in the insert's transaction,
+        # and kept if none of the rounds could be generated
+        assessments = [assessment for assessment in (future.result() for future in futures) if assessment is not None]
+        if not assessments:
+            return 0
+        return bank.add_assessments(pathway, level, assessments, replace=rebuild)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        submitted = [
+            (pathway, level, [executor.submit(generate, pathway, metadata, level) for _ in range(rounds)])
+            for pathway, metadata, level in groups
+        ]
+        stored = sum(store(*group) for group in submitted)
+    print(f' -- Stored {stored} questions in "{bank.path}".')
+    return stored
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate assessment questions for every catalog pathway.")
+    parser.add_argument("--csv", default="one.csv", help="Learning path CSV file")
+    parser.add_argument("--levels", nargs="+", default=list(EXPERIENCE_LEVELS), choices=EXPERIENCE_LEVELS)
+    parser.add_argument("--rounds", type=int, default=1, help="Assessments generated per pathway and level")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent LLM calls")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate pathways that already have questions")
+    parser.add_argument("--bank", default=None, help=f"Bank file (default: ASSESSMENT_BANK_PATH or {DEFAULT_BANK_PATH})")
+    args = parser.parse_args()
+    build_bank(args.csv, args.levels, args.rounds, args.concurrency, args.rebuild, AssessmentBank(args.bank))
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,71 @@
-import os
-from langchain_community.vectorstores import FAISS
+import asyncio
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
+from grading import build_free_text_prompt, combine_evaluation, free_text_items, load_assessment, parse_free_text_grades, section_items
+from assessment_bank import assessment_sections, get_assessment_bank
+from assessment_schema import (
+    ASSESSMENT_JSON_EXAMPLE, SECTION_COUNTS, Assessment, Evaluation, parse_assessment, parse_json_object
+)
+from llm_gateway import get_llm
+from singleflight import SingleFlight
+from token_budget import pack_texts, topics_token_budget, truncate_to_budget
 
 # Load environment variables
 load_dotenv('new.env')
 
+# Concurrent requests for the same assessment share one LLM call
+_assessment_flights = SingleFlight()
+
+# Generates assessments in the background, ahead of the learner asking for them
+_prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="assessment-prefetch")
+
+def assessment_request_key(learning_path_data, user_info):
+    """
+    Key identifying identical assessment requests (same learning path and profile).
+    """
+    return json.dumps([learning_path_data, user_info], sort_keys=True, default=str)
+
+def extract_course_rows(learning_path_data):
+    """
+    Read the (pathway, module) pairs from the course table of a learning path.
+
+    Args:
+        learning_path_data (str): Learning path text containing a markdown table
+            with a "Learning Pathway" column
+
+    Returns:
+        list: (pathway, module) tuples in table order; module is "" if there is no Module column
+    """
+    rows = []
+    columns = None
+    for line in learning_path_data.splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            columns = None
+            continue
+        cells = [cell.strip().replace("\\|", "|") for cell in re.split(r"(?<!\\)\|", line.strip("|"))]
+        if columns is None:
+            # Header row: find the pathway and module columns
+            names = [cell.lower() for cell in cells]
+            if "learning pathway" in names:
+                columns = (names.index("learning pathway"), names.index("module") if "module" in names else None)
+            continue
+        if set("".join(cells)) <= set("-: "):
+            continue
+        pathway = cells[columns[0]] if columns[0] < len(cells) else ""
+        module = cells[columns[1]] if columns[1] is not None and columns[1] < len(cells) else ""
+        if pathway:
+            rows.append((pathway, module))
+    return rows
+
 class AssessmentGenerator:
-    def __init__(self):
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not self.gemini_api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        # Initialize the model
-        try:
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-pro",
-                temperature=0.7,
-                google_api_key=self.gemini_api_key
-            )
-        except Exception as e:
-            print(f"Error initializing Gemini model: {e}")
-            print("Trying fallback model...")
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-pro",
-                temperature=0.7,
-                google_api_key=self.gemini_api_key
-            )
+    def __init__(self, llm=None):
+        # The shared gateway handles rate limiting, retries and model fallback
+        self.llm = llm if llm is not None else get_llm(temperature=0.7, json_mode=True)
     
     def generate_assessment(self, learning_path_data, user_info):
         """
@@ -40,6 +78,51 @@ class AssessmentGenerator:
         Returns:
             dict: Assessment with sections for different question types
         """
+        prompt = self._build_assessment_prompt(learning_path_data, user_info)
+        
+        try:
+            response = self.llm.invoke(prompt)
+            assessment_text = response.content
+            
+            # Process the response to extract JSON content
+            # Note: We'll handle non-JSON responses properly in the UI
+            return assessment_text
+        except Exception as e:
+            return f"Error generating assessment: {str(e)}"
+    
+    def stream_assessment(self, learning_path_data, user_info):
+        """
+        Stream an assessment as it is generated.
+        
+        Args:
+            learning_path_data (str): The content of the learning path
+            user_info (dict): User information including experience level, goals, etc.
+            
+        Yields:
+            str: Chunks of the assessment text
+        """
+        prompt = self._build_assessment_prompt(learning_path_data, user_info)
+        
+        try:
+            for chunk in self.llm.stream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            yield f"Error generating assessment: {str(e)}"
+    
+    async def agenerate_assessment(self, learning_path_data, user_info):
+        """
+        Asynchronous version of generate_assessment for the ASGI service.
+        """
+        prompt = self._build_assessment_prompt(learning_path_data, user_info)
+        
+        try:
+            response = await self.llm.ainvoke(prompt)
+            return response.content
+        except Exception as e:
+            return f"Error generating assessment: {str(e)}"
+    
+    def _build_assessment_prompt(self, learning_path_data, user_info):
         # Extract skills and topics from the learning path
         topics = self._extract_topics(learning_path_data)
         
@@ -79,12 +162,12 @@ class AssessmentGenerator:
                - Create 3 reflection questions to help the user assess their own understanding
                - These should encourage critical thinking about what they've learned
             
-            Format your response as a structured assessment with clear sections, instructions, and question numbering.
             Make sure the assessment is challenging but appropriate for a {experience_level} level learner.
             
-            Return the results in a JSON format with four keys: 'multiple_choice', 'short_answer', 'practical_exercise', and 'self_assessment'.
+            Return only a JSON object with this structure, where correct_answer is the letter of the correct option:
+            {structure}
             """,
-            input_variables=["name", "experience_level", "category", "goals", "topics"]
+            input_variables=["name", "experience_level", "category", "goals", "topics", "structure"]
         )
         
         # Prepare the input for the prompt
@@ -93,106 +176,277 @@ class AssessmentGenerator:
             "experience_level": user_info.get("experience_level", "Beginner"),
             "category": user_info.get("learning_category", "General"),
             "goals": user_info.get("goals", "Learning new skills"),
-            "topics": topics
+            "topics": topics,
+            "structure": ASSESSMENT_JSON_EXAMPLE
         }
         
-        # Generate the assessment
-        prompt = prompt_template.format(**input_data)
+        return prompt_template.format(**input_data)
+    
+    def complete_assessment(self, assessment_text, learning_path_data, user_info):
+        """
+        Parse a generated assessment and re-request only the sections it is missing.
         
-        try:
-            response = self.llm.invoke(prompt)
-            assessment_text = response.content
+        Truncated output is repaired, malformed questions are dropped, and each
+        section left with too few questions is asked for on its own, so a bad
+        completion never costs a whole new assessment.
+        
+        Args:
+            assessment_text (str): The generated assessment
+            learning_path_data (str): The content of the learning path
+            user_info (dict): User information
             
-            # Process the response to extract JSON content
-            # Note: We'll handle non-JSON responses properly in the UI
-            return assessment_text
-        except Exception as e:
-            return f"Error generating assessment: {str(e)}"
+        Returns:
+            dict: The assessment in the assessment_schema.Assessment shape
+        """
+        assessment = Assessment.from_dict(parse_assessment(assessment_text))
+        for section in assessment.broken_sections():
+            prompt = self._build_section_prompt(section, assessment, learning_path_data, user_info)
+            try:
+                response = self.llm.invoke(prompt)
+                assessment.extend(section, section_items(parse_json_object(response.content) or {}, section), SECTION_COUNTS[section])
+            except Exception as e:
+                print(f' -- Re-requesting the "{section}" section failed: {e}')
+        return assessment.to_dict()
+    
+    async def acomplete_assessment(self, assessment_text, learning_path_data, user_info):
+        """
+        Asynchronous version of complete_assessment; broken sections are re-requested concurrently.
+        """
+        assessment = Assessment.from_dict(parse_assessment(assessment_text))
+        sections = assessment.broken_sections()
+        responses = await asyncio.gather(*(
+            self.llm.ainvoke(self._build_section_prompt(section, assessment, learning_path_data, user_info))
+            for section in sections
+        ), return_exceptions=True)
+        for section, response in zip(sections, responses):
+            if isinstance(response, Exception):
+                print(f' -- Re-requesting the "{section}" section failed: {response}')
+                continue
+            assessment.extend(section, section_items(parse_json_object(response.content) or {}, section), SECTION_COUNTS[section])
+        return assessment.to_dict()
+    
+    def _build_section_prompt(self, section, assessment, learning_path_data, user_info):
+        # Ask for one section only, in the same shape as the full assessment
+        count = max(1, SECTION_COUNTS[section] - len(getattr(assessment, section)))
+        structure = json.dumps({section: json.loads(ASSESSMENT_JSON_EXAMPLE)[section]}, indent=2)
+        return f"""
+            You are an expert education assessment creator. Write {count} more "{section}" item(s) for an assessment.
+            The learner's experience level is {user_info.get("experience_level", "Beginner")}.
+            
+            They have been studying the following topics/learning paths:
+            {self._extract_topics(learning_path_data)}
+            
+            Return only a JSON object with this structure, where correct_answer is the letter of the correct option:
+            {structure}
+            """
     
     def _extract_topics(self, learning_path_data):
         """
         Extract relevant topics from the learning path data.
         
+        The course table is reduced to one "pathway (module)" line per course,
+        without links or durations, and packed into ASSESSMENT_TOPICS_TOKEN_BUDGET.
+        Learning paths without a table are truncated to the same budget.
+        
         Args:
             learning_path_data (str): The content of the learning path
             
         Returns:
             str: Extracted topics as a string
         """
-        # For simplicity, we'll just return the learning path data
-        # In a more sophisticated implementation, you might use regex or other methods
-        # to extract just the topic names or course titles
-        return learning_path_data
+        topics = [
+            f"- {pathway} ({module})" if module else f"- {pathway}"
+            for pathway, module in extract_course_rows(learning_path_data)
+        ]
+        if not topics:
+            return truncate_to_budget(learning_path_data, topics_token_budget())
+        return "\n".join(pack_texts(topics, topics_token_budget()))
 
     def evaluate_user_answers(self, assessment, user_answers):
         """
         Evaluate user answers against the assessment.
         
+        Multiple-choice answers of a structured assessment are graded locally;
+        only the free-text answers are sent to the LLM, in one call.
+        
         Args:
             assessment (dict): The assessment with questions and correct answers
             user_answers (dict): The user's submitted answers
             
         Returns:
-            dict: Evaluation results with feedback and score
+            str: Evaluation results with feedback and score, as JSON
         """
         try:
-            # Create prompt for answer evaluation
-            prompt_template = PromptTemplate(
-                template="""
-                You are an expert education assessment evaluator. Evaluate the user's answers for the following assessment:
-                
-                Assessment: 
-                {assessment}
-                
-                User's Answers:
-                {user_answers}
-                
-                Provide detailed feedback for each answer, indicating what was correct and what could be improved.
-                For multiple choice questions, mark each as correct or incorrect.
-                For short answer questions, provide constructive feedback.
-                For practical exercises, evaluate based on the specified criteria.
-                
-                Calculate an overall score as a percentage.
-                
-                Return the results in a JSON format with the following structure:
-                {{
-                    "score": 85,
-                    "feedback": {{
-                        "multiple_choice": [...],
-                        "short_answer": [...],
-                        "practical_exercise": [...],
-                        "self_assessment": [...]
-                    }},
-                    "strengths": ["..."],
-                    "areas_for_improvement": ["..."],
-                    "recommendations": ["..."]
-                }}
-                """,
-                input_variables=["assessment", "user_answers"]
-            )
-            
-            # Prepare the input for the prompt
-            input_data = {
-                "assessment": str(assessment),
-                "user_answers": str(user_answers)
-            }
-            
-            # Generate the evaluation
-            prompt = prompt_template.format(**input_data)
-            
-            response = self.llm.invoke(prompt)
-            evaluation_text = response.content
+            structured = load_assessment(assessment)
+            if structured is None or not isinstance(user_answers, dict):
+                response = self.llm.invoke(self._build_evaluation_prompt(assessment, user_answers))
+                return self._normalize_evaluation(response.content)
+
+            items = free_text_items(structured, user_answers)
+            llm_result = None
+            if items:
+                try:
+                    response = self.llm.invoke(build_free_text_prompt(items))
+                    llm_result = parse_free_text_grades(response.content)
+                except Exception as e:
+                    print(f' -- Free-text grading failed, returning the local grades only: {e}')
+            return json.dumps(combine_evaluation(structured, user_answers, items, llm_result), indent=2)
+        except Exception as e:
+            return f"Error evaluating answers: {str(e)}"
+    
+    def stream_evaluation(self, assessment, user_answers):
+        """
+        Stream the evaluation of user answers as it is generated.
+        
+        A structured assessment is graded in one piece (the LLM only returns
+        free-text grades, which are combined before anything can be shown).
+        
+        Args:
+            assessment (dict): The assessment with questions and correct answers
+            user_answers (dict): The user's submitted answers
             
-            # Process the response to extract JSON content
-            # Here we would implement JSON extraction logic similar to what's in the Streamlit app
-            return evaluation_text
+        Yields:
+            str: Chunks of the evaluation text
+        """
+        if load_assessment(assessment) is not None and isinstance(user_answers, dict):
+            yield self.evaluate_user_answers(assessment, user_answers)
+            return
+        try:
+            prompt = self._build_evaluation_prompt(assessment, user_answers)
+            for chunk in self.llm.stream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            yield f"Error evaluating answers: {str(e)}"
+    
+    async def aevaluate_user_answers(self, assessment, user_answers):
+        """
+        Asynchronous version of evaluate_user_answers for the ASGI service.
+        """
+        try:
+            structured = load_assessment(assessment)
+            if structured is None or not isinstance(user_answers, dict):
+                response = await self.llm.ainvoke(self._build_evaluation_prompt(assessment, user_answers))
+                return self._normalize_evaluation(response.content)
+
+            items = free_text_items(structured, user_answers)
+            llm_result = None
+            if items:
+                try:
+                    response = await self.llm.ainvoke(build_free_text_prompt(items))
+                    llm_result = parse_free_text_grades(response.content)
+                except Exception as e:
+                    print(f' -- Free-text grading failed, returning the local grades only: {e}')
+            return json.dumps(combine_evaluation(structured, user_answers, items, llm_result), indent=2)
         except Exception as e:
             return f"Error evaluating answers: {str(e)}"
+    
+    @staticmethod
+    def _normalize_evaluation(evaluation_text):
+        # Return the model's evaluation in the Evaluation schema, or as-is if it isn't usable JSON
+        evaluation = Evaluation.from_dict(parse_json_object(evaluation_text))
+        return json.dumps(evaluation.to_dict(), indent=2) if evaluation is not None else evaluation_text
+    
+    def _build_evaluation_prompt(self, assessment, user_answers):
+        # Create prompt for answer evaluation
+        prompt_template = PromptTemplate(
+            template="""
+            You are an expert education assessment evaluator. Evaluate the user's answers for the following assessment:
+            
+            Assessment: 
+            {assessment}
+            
+            User's Answers:
+            {user_answers}
+            
+            Provide detailed feedback for each answer, indicating what was correct and what could be improved.
+            For multiple choice questions, mark each as correct or incorrect.
+            For short answer questions, provide constructive feedback.
+            For practical exercises, evaluate based on the specified criteria.
+            
+            Calculate an overall score as a percentage.
+            
+            Return the results in a JSON format with the following structure:
+            {{
+                "score": 85,
+                "feedback": {{
+                    "multiple_choice": [...],
+                    "short_answer": [...],
+                    "practical_exercise": [...],
+                    "self_assessment": [...]
+                }},
+                "strengths": ["..."],
+                "areas_for_improvement": ["..."],
+                "recommendations": ["..."]
+            }}
+            """,
+            input_variables=["assessment", "user_answers"]
+        )
+        
+        # Prepare the input for the prompt
+        input_data = {
+            "assessment": str(assessment),
+            "user_answers": str(user_answers)
+        }
+        
+        return prompt_template.format(**input_data)
+
+_generator = None
+_generator_lock = threading.Lock()
+
+def get_assessment_generator():
+    """
+    Return the process-wide assessment generator, creating it on first use.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = AssessmentGenerator()
+        return _generator
+
+def assemble_assessment(learning_path_data, user_info):
+    """
+    Assemble an assessment from the pre-generated assessment bank.
+
+    Questions are sampled for the pathways in the learning path's table at the
+    learner's experience level. Pathways the bank doesn't cover are sent to
+    the LLM in one call, and its questions are mixed in.
+
+    Args:
+        learning_path_data (str): The learning path content
+        user_info (dict): User information
+
+    Returns:
+        str: The assessment as JSON, or None if the bank covers none of the pathways
+    """
+    bank = get_assessment_bank()
+    if bank is None:
+        return None
+    rows = extract_course_rows(learning_path_data)
+    pathways = [pathway for pathway, _ in rows]
+    level = user_info.get("experience_level", "Beginner")
+    covered = set(bank.covered_pathways(pathways, level))
+    if not covered:
+        return None
+
+    extra_items = None
+    missing = [(pathway, module) for pathway, module in rows if pathway not in covered]
+    if missing:
+        topics = "\n".join(f"- {pathway} ({module})" if module else f"- {pathway}" for pathway, module in missing)
+        generated = parse_assessment(get_assessment_generator().generate_assessment(topics, user_info))
+        if generated is not None:
+            extra_items = {}
+            for section, item in assessment_sections(generated):
+                extra_items.setdefault(section, []).append(item)
+    return json.dumps(bank.sample(pathways, level, extra_items), indent=2)
 
 def generate_assessment(learning_path_data, user_info):
     """
     Generate an assessment based on a learning path.
     
+    The assessment bank is used when it covers the learning path; otherwise
+    the whole assessment is generated by the LLM.
+    
     Args:
         learning_path_data (str): The learning path content
         user_info (dict): User information
@@ -200,12 +454,34 @@ def generate_assessment(learning_path_data, user_info):
     Returns:
         str: The generated assessment
     """
+    def generate():
+        assembled = assemble_assessment(learning_path_data, user_info)
+        if assembled is not None:
+            return assembled
+        generator = get_assessment_generator()
+        assessment_text = generator.generate_assessment(learning_path_data, user_info)
+        if assessment_text.startswith("Error generating assessment:"):
+            return assessment_text
+        return json.dumps(generator.complete_assessment(assessment_text, learning_path_data, user_info), indent=2)
+
     try:
-        generator = AssessmentGenerator()
-        return generator.generate_assessment(learning_path_data, user_info)
+        return _assessment_flights.do(assessment_request_key(learning_path_data, user_info), generate)
     except Exception as e:
         return f"Error generating assessment: {str(e)}"
 
+def prefetch_assessment(learning_path_data, user_info):
+    """
+    Start generating an assessment in the background.
+
+    Args:
+        learning_path_data (str): The learning path content
+        user_info (dict): User information
+
+    Returns:
+        Future: Resolves to the same text generate_assessment returns
+    """
+    return _prefetch_executor.submit(generate_assessment, learning_path_data, dict(user_info))
+
 def evaluate_user_answers(assessment, user_answers):
     """
     Evaluate user answers against the assessment.
@@ -215,10 +491,84 @@ def evaluate_user_answers(assessment, user_answers):
         user_answers (dict): The user's submitted answers
         
     Returns:
-        dict: Evaluation results with feedback and score
+        str: Evaluation results with feedback and score, as JSON
     """
     try:
-        generator = AssessmentGenerator()
+        generator = get_assessment_generator()
         return generator.evaluate_user_answers(assessment, user_answers)
     except Exception as e:
-        return f"Error evaluating answers: {str(e)}"
\ No newline at end of file
+        return f"Error evaluating answers: {str(e)}"
+
+def stream_assessment(learning_path_data, user_info):
+    """
+    Stream an assessment based on a learning path.
+    
+    Args:
+        learning_path_data (str): The learning path content
+        user_info (dict): User information
+        
+    Yields:
+        str: Chunks of the generated assessment
+    """
+    try:
+        assembled = assemble_assessment(learning_path_data, user_info)
+        if assembled is not None:
+            yield assembled
+            return
+        generator = get_assessment_generator()
+        yield from generator.stream_assessment(learning_path_data, user_info)
+    except Exception as e:
+        yield f"Error generating assessment: {str(e)}"
+
+async def agenerate_assessment(learning_path_data, user_info):
+    """
+    Asynchronous version of generate_assessment for the ASGI service.
+    """
+    loop = asyncio.get_running_loop()
+    assembled = await loop.run_in_executor(None, assemble_assessment, learning_path_data, user_info)
+    if assembled is not None:
+        return assembled
+    generator = get_assessment_generator()
+    assessment_text = await generator.agenerate_assessment(learning_path_data, user_info)
+    if assessment_text.startswith("Error generating assessment:"):
+        return assessment_text
+    assessment = await generator.acomplete_assessment(assessment_text, learning_path_data, user_info)
+    return json.dumps(assessment, indent=2)
+
+def complete_assessment(assessment_text, learning_path_data, user_info):
+    """
+    Parse a generated or streamed assessment, re-requesting only its broken sections.
+    
+    Args:
+        assessment_text (str): The assessment text
+        learning_path_data (str): The learning path content
+        user_info (dict): User information
+        
+    Returns:
+        dict: The assessment, or None if it failed or has no usable questions
+    """
+    if assessment_text.startswith("Error generating assessment:"):
+        return None
+    try:
+        assessment = get_assessment_generator().complete_assessment(assessment_text, learning_path_data, user_info)
+    except Exception as e:
+        print(f' -- Completing the assessment failed: {e}')
+        return None
+    return None if Assessment.from_dict(assessment).is_empty() else assessment
+
+def stream_evaluation(assessment, user_answers):
+    """
+    Stream the evaluation of user answers.
+    
+    Args:
+        assessment (dict): The assessment with questions and correct answers
+        user_answers (dict): The user's submitted answers
+        
+    Yields:
+        str: Chunks of the evaluation
+    """
+    try:
+        generator = get_assessment_generator()
+        yield from generator.stream_evaluation(assessment, user_answers)
+    except Exception as e:
+        yield f"Error evaluating answers: {str(e)}"
@@ -0,0 +1,338 @@
+import json
+import re
+from collections import deque
+from dataclasses import asdict, dataclass, field
+
+# Typed schemas for the assessment and evaluation JSON, and a tolerant parser for LLM output.
+# Model output is often wrapped in prose or a ```json fence, uses "practical_exercises"
+# for "practical_exercise", or is cut off by the output token limit. The parser keeps
+# every complete value of a truncated object, and the schemas drop malformed items, so
+# only the sections left short need to be asked for again.
+
+# Questions per section requested by the assessment prompt
+SECTION_COUNTS = {
+    "multiple_choice": 5,
+    "short_answer": 3,
+    "practical_exercise": 2,
+    "self_assessment": 3,
+}
+
+# Fewest valid items a generated section needs; shorter sections are re-requested
+SECTION_MINIMUMS = {
+    "multiple_choice": 5,
+    "short_answer": 3,
+    "practical_exercise": 1,
+    "self_assessment": 3,
+}
+
+# Other names models use for the sections
+SECTION_ALIASES = {
+    "practical_exercises": "practical_exercise",
+    "multiple_choice_questions": "multiple_choice",
+    "short_answer_questions": "short_answer",
+    "self_assessment_reflection": "self_assessment",
+}
+
+def canonical_section(key):
+    return SECTION_ALIASES.get(key, key)
+
+def _text(value):
+    return " ".join(str(value).split()) if isinstance(value, (str, int, float)) and not isinstance(value, bool) else ""
+
+def _texts(value):
+    if isinstance(value, str):
+        value = [line.strip(" -*") for line in value.splitlines()]
+    if not isinstance(value, list):
+        return []
+    return [text for text in (_text(item) for item in value) if text]
+
+def _normalize(text):
+    return " ".join(str(text).split()).casefold()
+
+def _strip_letter(text):
+    # "B. Some option" / "(b) Some option" -> "Some option"
+    return re.sub(r"^\(?[A-Za-z][.)]\s+", "", str(text).strip())
+
+def choice_index(value, options):
+    """
+    Resolve an answer ("B", "b)", "B. text", the option text or a 0-based index) to an option index.
+
+    Returns:
+        int: The option index, or None if it doesn't match any option
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if 0 <= value < len(options) else None
+    text = str(value).strip()
+    if not text:
+        return None
+    for index, option in enumerate(options):
+        if _normalize(option) == _normalize(text):
+            return index
+    letter = re.match(r"^\(?([A-Za-z])(?:[.):]|\s|$)", text)
+    if letter:
+        index = ord(letter.group(1).upper()) - ord("A")
+        if 0 <= index < len(options):
+            return index
+    for index, option in enumerate(options):
+        if _normalize(_strip_letter(option)) == _normalize(_strip_letter(text)):
+            return index
+    return None
+
+@dataclass
+class MultipleChoiceQuestion:
+    question: str
+    options: list
+    correct_answer: str  # Letter of the correct option
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a question from model output; None if it has no question, options or valid answer.
+        """
+        if not isinstance(data, dict):
+            return None
+        options = [_strip_letter(option) for option in _texts(data.get("options"))]
+        correct = choice_index(data.get("correct_answer", data.get("answer")), _texts(data.get("options")))
+        question = _text(data.get("question"))
+        if not question or len(options) < 2 or correct is None:
+            return None
+        return cls(question, options, chr(ord("A") + correct))
+
+@dataclass
+class ShortAnswerQuestion:
+    question: str
+    guidance: str = ""
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, str):
+            data = {"question": data}
+        if not isinstance(data, dict) or not _text(data.get("question")):
+            return None
+        guidance = data.get("guidance", data.get("guideline", data.get("guidelines", "")))
+        return cls(_text(data["question"]), _text(guidance) or " ".join(_texts(guidance)))
+
+@dataclass
+class PracticalExercise:
+    title: str
+    description: str
+    steps: list = field(default_factory=list)
+    criteria: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            return None
+        title = _text(data.get("title"))
+        description = _text(data.get("description", data.get("instructions", "")))
+        if not title or not description:
+            return None
+        steps = _texts(data.get("steps", data.get("requirements")))
+        criteria = _texts(data.get("criteria", data.get("evaluation_criteria")))
+        return cls(title, description, steps, criteria)
+
+def _self_assessment_item(data):
+    if isinstance(data, dict):
+        data = data.get("question", data.get("prompt"))
+    return _text(data) or None
+
+# Builds one valid item of each section from model output, or returns None
+SECTION_ITEM_PARSERS = {
+    "multiple_choice": MultipleChoiceQuestion.from_dict,
+    "short_answer": ShortAnswerQuestion.from_dict,
+    "practical_exercise": PracticalExercise.from_dict,
+    "self_assessment": _self_assessment_item,
+}
+
+@dataclass
+class Assessment:
+    multiple_choice: list = field(default_factory=list)
+    short_answer: list = field(default_factory=list)
+    practical_exercise: list = field(default_factory=list)
+    self_assessment: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build an assessment from model output, keeping only the valid items of each section.
+        """
+        assessment = cls()
+        for key, items in (data or {}).items():
+            section = canonical_section(key)
+            if section in SECTION_ITEM_PARSERS:
+                assessment.extend(section, items)
+        return assessment
+
+    def extend(self, section, items, limit=None):
+        """
+        Add the valid items of a section, skipping duplicates, until it holds limit items.
+        """
+        if not isinstance(items, list):
+            items = [items]
+        current = getattr(self, section)
+        for item in items:
+            if limit is not None and len(current) >= limit:
+                break
+            parsed = SECTION_ITEM_PARSERS[section](item)
+            if parsed is not None and parsed not in current:
+                current.append(parsed)
+
+    def broken_sections(self):
+        """
+        The sections with fewer valid items than SECTION_MINIMUMS.
+        """
+        return [section for section, minimum in SECTION_MINIMUMS.items() if len(getattr(self, section)) < minimum]
+
+    def is_empty(self):
+        return not any(getattr(self, section) for section in SECTION_COUNTS)
+
+    def to_dict(self):
+        return asdict(self)
+
+@dataclass
+class Evaluation:
+    score: int = 0
+    feedback: dict = field(default_factory=lambda: {section: [] for section in SECTION_COUNTS})
+    strengths: list = field(default_factory=list)
+    areas_for_improvement: list = field(default_factory=list)
+    recommendations: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build an evaluation from model output; None if it has no usable score.
+        """
+        if not isinstance(data, dict):
+            return None
+        try:
+            score = round(max(0.0, min(100.0, float(str(data.get("score")).rstrip("%")))))
+        except (TypeError, ValueError):
+            return None
+        feedback = {section: [] for section in SECTION_COUNTS}
+        raw_feedback = data.get("feedback")
+        for key, items in (raw_feedback.items() if isinstance(raw_feedback, dict) else ()):
+            section = canonical_section(key)
+            if section in feedback:
+                feedback[section] = items if isinstance(items, list) else [items]
+        return cls(
+            score, feedback, _texts(data.get("strengths")),
+            _texts(data.get("areas_for_improvement")), _texts(data.get("recommendations"))
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+# JSON shape shown to the model in the assessment prompt
+ASSESSMENT_JSON_EXAMPLE = json.dumps(Assessment(
+    [MultipleChoiceQuestion("...", ["...", "...", "...", "..."], "A")],
+    [ShortAnswerQuestion("...", "What a good answer covers")],
+    [PracticalExercise("...", "...", ["..."], ["..."])],
+    ["..."],
+).to_dict(), indent=2)
+
+class StreamingJSONParser:
+    """
+    Incremental, tolerant parser for a JSON object in model output.
+
+    Text is fed as it arrives. The scanner remembers the last point at which
+    every value so far is complete, and the brackets open there, so the
+    best-effort object can be rebuilt at any time by cutting the text at that
+    point and closing the brackets. Scanning is linear in the total input.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._start = None
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        # (end, closing brackets) of the latest points where the text is a complete prefix
+        self._cuts = deque(maxlen=8)
+        self.complete = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self._start is None:
+            start = self.text.find("{", self._position)
+            if start < 0:
+                self._position = len(self.text)
+                return
+            self._start = self._position = start
+        while self._position < len(self.text) and not self.complete:
+            char = self.text[self._position]
+            self._position += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append("}" if char == "{" else "]")
+                self._cut(self._position)
+            elif char in "}]":
+                if not self._stack or self._stack[-1] != char:
+                    # Malformed: keep what parsed so far
+                    self.complete = True
+                    break
+                self._stack.pop()
+                if not self._stack:
+                    self.complete = True
+                    self._cuts.append((self._position, ""))
+                else:
+                    self._cut(self._position)
+            elif char == ",":
+                # A comma always follows a complete value
+                self._cut(self._position - 1)
+
+    def _cut(self, end):
+        self._cuts.append((end, "".join(reversed(self._stack))))
+
+    def value(self):
+        """
+        The object parsed so far (completing a truncated one), or None if nothing parses yet.
+        """
+        for end, closing in reversed(self._cuts):
+            try:
+                value = json.loads(self.text[self._start:end] + closing)
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                return value
+        return None
+
+def parse_json_object(text):
+    """
+    Parse the JSON object in model output, repairing it if it was cut off.
+
+    Returns:
+        dict: The parsed object, or None if the text contains none
+    """
+    if not text:
+        return None
+    match = re.search(r"```(?:json)?\s*([\s\S]*?)(?:```|$)", text)
+    parser = StreamingJSONParser()
+    parser.feed(match.group(1) if match else text)
+    return parser.value()
+
+def parse_assessment(assessment_text):
+    """
+    Parse a generated assessment into a dict, or None if it has no JSON object.
+    """
+    return parse_json_object(assessment_text)
+
+def validate_assessment(data):
+    """
+    Normalise parsed model output to the assessment schema.
+
+    Returns:
+        tuple: (assessment dict, list of sections that need re-requesting)
+    """
+    assessment = Assessment.from_dict(data if isinstance(data, dict) else {})
+    return assessment.to_dict(), assessment.broken_sections()
@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+from recommendation_model import generate_learning_paths
+
+# Offline batch recommendations for cohort onboarding, e.g.:
+#   python batch_recommend.py --input cohort.jsonl --output learning_paths.jsonl
+# Each input line is a JSON object with an optional "id" and either a "query" or
+# the learner profile fields (learning_category, experience_level, available_time, goals).
+# Each output line holds the same "id" plus either "learning_path" or "error".
+
+def read_items(lines):
+    items = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            item = {"error": f"Invalid JSON on line {line_number}: {e}"}
+        if not isinstance(item, dict):
+            item = {"error": f"Line {line_number} is not a JSON object"}
+        item.setdefault("id", line_number)
+        items.append(item)
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate learning paths for a JSONL file of learners.")
+    parser.add_argument("--input", default="-", help="Input JSONL file (default: stdin)")
+    parser.add_argument("--output", default="-", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--csv", default="one.csv", help="Learning path CSV file")
+    parser.add_argument("--concurrency", type=int, default=None, help="Maximum concurrent LLM calls")
+    args = parser.parse_args()
+
+    if args.input == "-":
+        items = read_items(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as input_file:
+            items = read_items(input_file)
+
+    # Lines that could not be parsed are reported as errors without being sent to the model
+    valid_items = [item for item in items if "error" not in item]
+    results = iter(generate_learning_paths(valid_items, csv_filename=args.csv, max_concurrency=args.concurrency))
+
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for item in items:
+            result = {"error": item["error"]} if "error" in item else next(results)
+            output_file.write(json.dumps({"id": item["id"], **result}) + "\n")
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
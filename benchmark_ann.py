@@ -0,0 +1,91 @@
+import argparse
+import time
+
+import numpy as np
+from ann_index import INDEX_TYPES, AnnIndexConfig, configure_search, create_index, index_memory_bytes
+
+# Recall-vs-latency benchmark for the FAISS index types supported by ann_index.py, e.g.:
+#   python benchmark_ann.py --sizes 10000 100000 1000000 --dimensions 768
+# Catalogs are synthetic clustered vectors (a mixture of Gaussians), so the
+# numbers resemble real embeddings more than uniform noise would. Ground truth
+# comes from the exact flat index.
+
+def synthetic_catalog(rows, centers, generator):
+    dimensions = centers.shape[1]
+    clusters = len(centers)
+    assignments = generator.integers(0, clusters, size=rows)
+    vectors = np.empty((rows, dimensions), dtype=np.float32)
+    # Generate in chunks to keep peak memory close to the size of the catalog
+    for start in range(0, rows, 100000):
+        end = min(rows, start + 100000)
+        noise = generator.normal(scale=0.3, size=(end - start, dimensions)).astype(np.float32)
+        vectors[start:end] = centers[assignments[start:end]] + noise
+    return vectors
+
+def build_index(config, vectors):
+    training_vectors = vectors[:config.training_size]
+    started = time.perf_counter()
+    index = create_index(config, training_vectors)
+    for start in range(0, len(vectors), 100000):
+        index.add(vectors[start:start + 100000])
+    configure_search(index, config)
+    return index, time.perf_counter() - started
+
+def measure(index, queries, k, ground_truth):
+    latencies = []
+    results = np.empty((len(queries), k), dtype=np.int64)
+    # One query at a time, as in the recommendation service
+    for position, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        results[position] = ids[0]
+    recall = np.mean([
+        len(set(found) & set(expected)) / k for found, expected in zip(results, ground_truth)
+    ])
+    latencies_ms = np.array(latencies) * 1000
+    return recall, np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types on synthetic course catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Catalog sizes (rows)")
+    parser.add_argument("--dimensions", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of queries per index")
+    parser.add_argument("--k", type=int, default=8, help="Neighbours per query (recall@k)")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: 4 * sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'index':>9} {'build s':>8} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8} {'memory MB':>10}")
+    for rows in args.sizes:
+        generator = np.random.default_rng(args.seed)
+        centers = generator.normal(size=(max(16, rows // 1000), args.dimensions)).astype(np.float32)
+        vectors = synthetic_catalog(rows, centers, generator)
+        # Queries come from the same clusters but are not copies of catalog rows
+        queries = synthetic_catalog(args.queries, centers, generator)
+
+        exact_index, _ = build_index(AnnIndexConfig("flat"), vectors)
+        _, ground_truth = exact_index.search(queries, args.k)
+
+        for index_type in args.index_types:
+            config = AnnIndexConfig(
+                index_type,
+                nlist=args.nlist or max(16, int(4 * np.sqrt(rows))),
+                nprobe=args.nprobe,
+                hnsw_m=args.hnsw_m,
+                ef_search=args.ef_search,
+                pq_m=args.pq_m,
+                training_size=min(rows, 100000),
+            )
+            index, build_seconds = (exact_index, 0.0) if index_type == "flat" else build_index(config, vectors)
+            recall, p50, p99 = measure(index, queries, args.k, ground_truth)
+            memory_mb = index_memory_bytes(index) / 2 ** 20
+            print(f"{rows:>9} {index_type:>9} {build_seconds:>8.1f} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f} {memory_mb:>10.1f}")
+
+if __name__ == '__main__':
+    main()
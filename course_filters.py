@@ -0,0 +1,104 @@
+import re
+
+# Streamlit "Category of Interest" options -> Domain values in the learning path CSV
+CATEGORY_DOMAINS = {
+    "web development": ["Web Development"],
+    "data science": ["Data Science"],
+    "mobile development": ["Android Development"],
+    "android development": ["Android Development"],
+    "ai/machine learning": ["Machine Learning"],
+    "machine learning": ["Machine Learning"],
+    "cybersecurity": ["Cybersecurity"],
+    "cloud computing": ["Cloud Computing"],
+    "game development": ["Game Development"],
+}
+
+# The CSV durations assume roughly this much study time per week
+BASELINE_HOURS_PER_WEEK = 10
+# A learning path should fit into about a quarter
+PLAN_HORIZON_WEEKS = 12
+
+_DURATION_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(?:(?:-|–|to)\s*(\d+(?:\.\d+)?))?\s*(day|week|month)s?",
+    re.IGNORECASE
+)
+_WEEKS_PER_UNIT = {"day": 1 / 7, "week": 1.0, "month": 4.35}
+
+def normalize_value(value):
+    return " ".join(str(value).split()).casefold()
+
+def parse_duration_weeks(duration):
+    """
+    Parse a Duration value such as "2 weeks", "2-3 Weeks" or "1 month" into weeks.
+
+    Args:
+        duration (str): The Duration column value
+
+    Returns:
+        tuple: (min_weeks, max_weeks), or (None, None) if it can't be parsed
+    """
+    match = _DURATION_PATTERN.search(duration or "")
+    if not match:
+        return None, None
+    unit = _WEEKS_PER_UNIT[match.group(3).lower()]
+    low = float(match.group(1)) * unit
+    high = float(match.group(2)) * unit if match.group(2) else low
+    return min(low, high), max(low, high)
+
+def max_weeks_for_hours(hours_per_week):
+    """
+    Longest nominal course duration that still fits the plan horizon at the given study time.
+    """
+    return PLAN_HORIZON_WEEKS * float(hours_per_week) / BASELINE_HOURS_PER_WEEK
+
+class CourseFilter:
+    """
+    Structured restrictions applied to the catalog before the vector search.
+
+    Empty fields don't restrict anything. Courses whose duration can't be
+    parsed are never excluded by the time budget.
+    """
+
+    def __init__(self, domains=None, modules=None, max_weeks=None):
+        self.domains = sorted({normalize_value(domain) for domain in domains or []})
+        self.modules = sorted({normalize_value(module) for module in modules or []})
+        self.max_weeks = max_weeks
+
+    @classmethod
+    def from_profile(cls, profile):
+        """
+        Build a filter from the learner profile collected by the Streamlit form.
+        """
+        category = normalize_value(profile.get("learning_category", ""))
+        hours = profile.get("available_time")
+        return cls(
+            domains=CATEGORY_DOMAINS.get(category),
+            max_weeks=max_weeks_for_hours(hours) if hours else None
+        )
+
+    @classmethod
+    def from_query(cls, query):
+        """
+        Build a filter from a free-text query, e.g. one made by format_profile_query.
+
+        Recognises category/domain names and "<n> hours per week".
+        """
+        text = normalize_value(query)
+        domains = []
+        for name, category_domains in CATEGORY_DOMAINS.items():
+            if re.search(rf"(?<![a-z]){re.escape(name)}(?![a-z])", text):
+                domains.extend(category_domains)
+        hours = re.search(r"(\d+(?:\.\d+)?)\s*hours?\s*(?:per|a|each|/)\s*week", text)
+        return cls(
+            domains=domains,
+            max_weeks=max_weeks_for_hours(hours.group(1)) if hours and float(hours.group(1)) > 0 else None
+        )
+
+    def is_empty(self):
+        return not self.domains and not self.modules and self.max_weeks is None
+
+    def key(self):
+        return (tuple(self.domains), tuple(self.modules), self.max_weeks)
+
+    def __repr__(self):
+        return f"CourseFilter(domains={self.domains}, modules={self.modules}, max_weeks={self.max_weeks})"
@@ -0,0 +1,431 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+
+# Gemini accepts at most 100 texts per batch embedding request
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite"
+DEFAULT_CACHE_MAX_ENTRIES = 1_000_000
+# Eviction runs once the cache holds this fraction more than max_entries, and trims it back to max_entries
+CACHE_EVICTION_SLACK = 0.1
+# Last-used times are written to SQLite in batches of this many keys, or at least this often
+LAST_USED_FLUSH_ENTRIES = 256
+LAST_USED_FLUSH_SECONDS = 60
+
+class GeminiEmbeddingProvider:
+    """
+    Embeds texts with the Gemini embedding API, one request per batch.
+    """
+
+    def __init__(self, api_key=None, model="models/embedding-001", request_timeout=60):
+        import google.generativeai as genai
+        from google.api_core import exceptions
+
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model = model
+        self.request_timeout = request_timeout
+        # Rate limiting and transient server errors are worth retrying; bad requests are not
+        self._retryable_errors = (
+            exceptions.ResourceExhausted,
+            exceptions.TooManyRequests,
+            exceptions.ServiceUnavailable,
+            exceptions.InternalServerError,
+            exceptions.DeadlineExceeded,
+        )
+
+    def embed(self, texts, task_type):
+        result = self._genai.embed_content(
+            model=self.model,
+            content=texts,
+            task_type=task_type,
+            request_options={"timeout": self.request_timeout}
+        )
+        return result["embedding"]
+
+    async def aembed(self, texts, task_type):
+        result = await self._genai.embed_content_async(
+            model=self.model,
+            content=texts,
+            task_type=task_type,
+            request_options={"timeout": self.request_timeout}
+        )
+        return result["embedding"]
+
+    def is_retryable(self, error):
+        return isinstance(error, self._retryable_errors)
+
+class HashingEmbeddingProvider:
+    """
+    Offline embedder based on feature hashing of words and word bigrams.
+
+    It needs no network access or model files, which makes it suitable for tests,
+    local development and load tests. Vectors are L2-normalised.
+    """
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+        self.model = f"hashing-{dimensions}"
+
+    def embed(self, texts, task_type):
+        return [self._embed_text(text) for text in texts]
+
+    async def aembed(self, texts, task_type):
+        return self.embed(texts, task_type)
+
+    def is_retryable(self, error):
+        return False
+
+    def _embed_text(self, text):
+        vector = [0.0] * self.dimensions
+        words = re.findall(r"[a-z0-9][a-z0-9+#.]*", text.lower())
+        features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm:
+            vector = [value / norm for value in vector]
+        return vector
+
+def create_embedding_provider(provider_name=None, api_key=None, request_timeout=60):
+    """
+    Create the embedding provider selected by name or by the EMBEDDING_PROVIDER variable.
+
+    Args:
+        provider_name (str): "gemini" (default) or "hashing"
+        api_key (str): Gemini API key
+        request_timeout (int): Timeout in seconds for each embedding request
+
+    Returns:
+        An object with embed(texts, task_type), aembed(texts, task_type),
+        is_retryable(error) and a model name
+    """
+    provider_name = (provider_name or os.getenv("EMBEDDING_PROVIDER", "gemini")).lower()
+    if provider_name == "gemini":
+        return GeminiEmbeddingProvider(api_key=api_key, request_timeout=request_timeout)
+    if provider_name == "hashing":
+        return HashingEmbeddingProvider()
+    raise ValueError(f"Unknown embedding provider: {provider_name}")
+
+# Custom GeminiEmbeddings class inheriting from Embeddings
+class GeminiEmbeddings(Embeddings):
+    """
+    LangChain embeddings that send texts to a provider in batches.
+
+    Batches run concurrently with bounded parallelism, transient failures are
+    retried with exponential backoff, and results keep the order of the input.
+    """
+
+    def __init__(self, api_key, request_timeout=60, provider=None, batch_size=None,
+                 max_concurrency=None, max_retries=None):
+        self.api_key = api_key
+        self.request_timeout = request_timeout
+        self.provider = provider or create_embedding_provider(api_key=api_key, request_timeout=request_timeout)
+        # Unset options fall back to EMBEDDING_* environment variables, then to the defaults
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        self.max_concurrency = max_concurrency or int(os.getenv("EMBEDDING_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("EMBEDDING_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def model(self):
+        # Recorded in the index manifest; changing it forces a full re-embedding
+        return self.provider.model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_batch(batch, "retrieval_document") for batch in batches]
+        else:
+            # Executor.map returns results in submission order, whatever order the batches finish in
+            results = self._get_executor().map(lambda batch: self._embed_batch(batch, "retrieval_document"), batches)
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed_batch([text], "retrieval_query")[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed many queries with batched requests (same batching as embed_documents).
+        """
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_batch(batch, "retrieval_query") for batch in batches]
+        else:
+            results = self._get_executor().map(lambda batch: self._embed_batch(batch, "retrieval_query"), batches)
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed(batch):
+            async with semaphore:
+                return await self._aembed_batch(batch, "retrieval_document")
+
+        # gather returns results in the order of its arguments
+        results = await asyncio.gather(*(embed(batch) for batch in batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self._aembed_batch([text], "retrieval_query"))[0]
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        thread_name_prefix="embeddings"
+                    )
+        return self._executor
+
+    def _embed_batch(self, texts, task_type):
+        attempt = 0
+        while True:
+            try:
+                vectors = self.provider.embed(texts, task_type)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not self.provider.is_retryable(e):
+                    raise
+                # Exponential backoff with full jitter, capped at 30 seconds
+                delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                attempt += 1
+                print(f' -- Embedding batch failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s.')
+                time.sleep(delay)
+
+    async def _aembed_batch(self, texts, task_type):
+        attempt = 0
+        while True:
+            try:
+                vectors = await self.provider.aembed(texts, task_type)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not self.provider.is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                attempt += 1
+                print(f' -- Embedding batch failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s.')
+                await asyncio.sleep(delay)
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed embedding cache in front of another Embeddings object.
+
+    Vectors are keyed by the embedding model name plus the SHA-256 of the text
+    and stored in a SQLite file, so unchanged course rows and repeated queries
+    are never embedded twice, even across restarts. A small in-memory LRU sits
+    in front of SQLite for hot queries. When the file grows past max_entries
+    by CACHE_EVICTION_SLACK, the least recently used vectors are evicted in one
+    batch. Last-used times are buffered and written in batches, so cache hits
+    don't write to SQLite.
+    """
+
+    def __init__(self, embeddings, cache_path=None, max_entries=None, memory_entries=4096):
+        self.embeddings = embeddings
+        self.cache_path = cache_path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES))
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        # Running count of stored vectors, so stores don't have to count the table
+        self._count = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._touched = {}
+        self._touched_flushed_at = time.time()
+
+    @property
+    def model(self):
+        return self.embeddings.model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors, missing = self._lookup_texts(texts)
+        if missing:
+            missing_keys = list(missing)
+            new_vectors = self.embeddings.embed_documents([texts[missing[key][0]] for key in missing_keys])
+            self._fill_missing(vectors, missing, missing_keys, new_vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        # Queries use a different task type than documents, so they get their own keys
+        key = self._key(text, "query")
+        vector = self._lookup([key])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store([(key, vector)])
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors, missing = self._lookup_texts(texts, "query")
+        if missing:
+            missing_keys = list(missing)
+            texts_to_embed = [texts[missing[key][0]] for key in missing_keys]
+            if hasattr(self.embeddings, "embed_queries"):
+                new_vectors = self.embeddings.embed_queries(texts_to_embed)
+            else:
+                new_vectors = [self.embeddings.embed_query(text) for text in texts_to_embed]
+            self._fill_missing(vectors, missing, missing_keys, new_vectors)
+        return vectors
+
+    # The async methods run the SQLite reads and writes in the default executor, off the event loop
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        loop = asyncio.get_running_loop()
+        keys, vectors, missing = await loop.run_in_executor(None, self._lookup_texts, texts)
+        if missing:
+            missing_keys = list(missing)
+            new_vectors = await self.embeddings.aembed_documents([texts[missing[key][0]] for key in missing_keys])
+            await loop.run_in_executor(None, self._fill_missing, vectors, missing, missing_keys, new_vectors)
+        return vectors
+
+    async def aembed_query(self, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        key = self._key(text, "query")
+        vector = (await loop.run_in_executor(None, self._lookup, [key]))[0]
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await loop.run_in_executor(None, self._store, [(key, vector)])
+        return vector
+
+    def _lookup_texts(self, texts, kind="document"):
+        keys = [self._key(text, kind) for text in texts]
+        vectors = self._lookup(keys)
+        # Each distinct missing text is embedded once, even if it appears several times
+        missing = {}
+        for position, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None:
+                missing.setdefault(key, []).append(position)
+        return keys, vectors, missing
+
+    def _fill_missing(self, vectors, missing, missing_keys, new_vectors):
+        self._store(zip(missing_keys, new_vectors))
+        for key, vector in zip(missing_keys, new_vectors):
+            for position in missing[key]:
+                vectors[position] = vector
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._connection.execute("DELETE FROM embeddings")
+            self._connection.commit()
+            self._count = 0
+
+    def _key(self, text, kind="document"):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model}:{kind}:{digest}"
+
+    def _lookup(self, keys):
+        vectors = [None] * len(keys)
+        uncached = {}
+        now = time.time()
+        with self._lock:
+            for position, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    vectors[position] = vector
+                else:
+                    uncached.setdefault(key, []).append(position)
+            if not uncached:
+                self._flush_touched(now)
+                return vectors
+
+            uncached_keys = list(uncached)
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(uncached_keys), 500):
+                chunk = uncached_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    self._remember(key, vector)
+                    self._touched[key] = now
+                    for position in uncached[key]:
+                        vectors[position] = vector
+            self._flush_touched(now)
+        return vectors
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            rows = []
+            for key, vector in items:
+                self._remember(key, vector)
+                rows.append((key, array("f", vector).tobytes(), now))
+            # Keys are content hashes, so a key that is already stored holds the same vector
+            cursor = self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._count += max(cursor.rowcount, 0)
+            if self._count > self.max_entries * (1 + CACHE_EVICTION_SLACK):
+                self._evict()
+            self._connection.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self, now, force=False):
+        # Called with the lock held
+        if not self._touched:
+            return
+        if (not force and len(self._touched) < LAST_USED_FLUSH_ENTRIES
+                and now - self._touched_flushed_at < LAST_USED_FLUSH_SECONDS):
+            return
+        self._connection.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()]
+        )
+        self._connection.commit()
+        self._touched.clear()
+        self._touched_flushed_at = now
+
+    def _evict(self):
+        # Called with the lock held. Other processes may share the file, so the
+        # running count is corrected here, once per eviction batch
+        self._flush_touched(time.time(), force=True)
+        self._count = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._count > self.max_entries:
+            cursor = self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN"
+                " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (self._count - self.max_entries,)
+            )
+            self._count -= max(cursor.rowcount, 0)
@@ -0,0 +1,217 @@
+import json
+from assessment_schema import Evaluation, choice_index, parse_assessment, parse_json_object
+
+# Grades a structured assessment (the JSON the assessment prompt asks for).
+# Multiple-choice questions already carry their correct answer, so they are
+# scored locally and instantly; only the free-text short answers and practical
+# exercises go to the LLM, together in one call, and the score and feedback
+# are combined here.
+
+# Sections graded by the LLM, and how many multiple-choice questions each item is worth
+FREE_TEXT_WEIGHTS = {
+    "short_answer": 1,
+    "practical_exercise": 2,
+}
+
+def load_assessment(assessment):
+    """
+    The assessment as a dict, parsing JSON text; None if it isn't a structured assessment.
+    """
+    if isinstance(assessment, str):
+        assessment = parse_assessment(assessment)
+    if not isinstance(assessment, dict):
+        return None
+    sections = ("multiple_choice", "short_answer", "practical_exercise", "practical_exercises", "self_assessment")
+    return assessment if any(section in assessment for section in sections) else None
+
+def section_items(data, section):
+    """
+    The list stored under a section, accepting "practical_exercises" for "practical_exercise".
+    """
+    items = data.get(section)
+    if items is None and section == "practical_exercise":
+        items = data.get("practical_exercises")
+    return items if isinstance(items, list) else []
+
+def section_answers(user_answers, section, count):
+    """
+    The learner's answers for a section as a list aligned with its questions.
+
+    Answers may be given as a list, or as a dict keyed by the 0-based question index.
+    """
+    answers = user_answers.get(section)
+    if answers is None and section == "practical_exercise":
+        answers = user_answers.get("practical_exercises")
+    if isinstance(answers, dict):
+        return [answers.get(index, answers.get(str(index))) for index in range(count)]
+    answers = list(answers or [])
+    return (answers + [None] * count)[:count]
+
+def text_list(value):
+    """
+    A list of non-empty strings from an LLM field that may be a list, a single string or null.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (str, int, float)):
+        value = [value]
+    elif not isinstance(value, (list, tuple)):
+        return []
+    return [str(entry).strip() for entry in value if entry is not None and str(entry).strip()]
+
+def grade_multiple_choice(questions, answers):
+    """
+    Score multiple-choice questions against their known correct answers.
+
+    Returns:
+        list: One feedback dict per question
+    """
+    feedback = []
+    for number, (question, answer) in enumerate(zip(questions, answers), start=1):
+        options = question.get("options") or []
+        correct = choice_index(question.get("correct_answer"), options)
+        chosen = choice_index(answer, options)
+        is_correct = correct is not None and chosen == correct
+        correct_text = options[correct] if correct is not None else question.get("correct_answer")
+        if answer in (None, ""):
+            comment = f"Not answered. The correct answer is {correct_text}."
+        elif is_correct:
+            comment = "Correct."
+        else:
+            comment = f"Incorrect. The correct answer is {correct_text}."
+        feedback.append({
+            "question": number,
+            "user_answer": answer,
+            "correct_answer": correct_text,
+            "correct": is_correct,
+            "feedback": comment,
+        })
+    return feedback
+
+def free_text_items(assessment, user_answers):
+    """
+    The answered short-answer and practical items that need the LLM to grade them.
+
+    Returns:
+        list: Dicts with id, section, number, question and answer
+    """
+    items = []
+    for section in FREE_TEXT_WEIGHTS:
+        questions = section_items(assessment, section)
+        for number, (question, answer) in enumerate(
+                zip(questions, section_answers(user_answers, section, len(questions))), start=1):
+            if answer in (None, "") or not str(answer).strip():
+                continue
+            items.append({
+                "id": f"{section}-{number}",
+                "section": section,
+                "number": number,
+                "question": question,
+                "answer": str(answer).strip(),
+            })
+    return items
+
+def build_free_text_prompt(items):
+    """
+    One prompt that asks the LLM to grade every free-text item at once.
+    """
+    blocks = []
+    for item in items:
+        question = item["question"]
+        if isinstance(question, dict):
+            question = {
+                key: value for key, value in question.items()
+                if key in ("question", "title", "description", "guidance", "guidelines", "steps", "criteria", "requirements")
+            }
+        blocks.append(
+            f"[{item['id']}]\nQuestion: {json.dumps(question, ensure_ascii=False)}\nAnswer: {item['answer']}"
+        )
+    return (
+        "You are an expert education assessment evaluator. Grade each answer below against its question,\n"
+        "guidance and criteria. Give each a score from 0 to 100 and one or two sentences of constructive feedback.\n\n"
+        + "\n\n".join(blocks)
+        + "\n\nReturn only JSON with this structure:\n"
+        '{"grades": [{"id": "short_answer-1", "score": 80, "feedback": "..."}],\n'
+        ' "strengths": ["..."], "areas_for_improvement": ["..."], "recommendations": ["..."]}\n'
+    )
+
+def parse_free_text_grades(text):
+    """
+    Parse the LLM's grading response; returns None if it isn't JSON.
+    """
+    return parse_json_object(text)
+
+def combine_evaluation(assessment, user_answers, items, llm_result):
+    """
+    Merge local multiple-choice grades and the LLM's free-text grades into the evaluation JSON.
+
+    Multiple-choice questions count one point each, and free-text items their
+    FREE_TEXT_WEIGHTS scaled by the LLM score. Unanswered items score zero.
+    Free-text items the LLM failed to grade are left out of the score.
+    Self-assessment reflections are recorded but not scored.
+
+    Args:
+        assessment (dict): The structured assessment
+        user_answers (dict): The learner's answers per section
+        items (list): The free-text items sent to the LLM (from free_text_items)
+        llm_result (dict): Parsed LLM response, or None if there was no call or it failed
+
+    Returns:
+        dict: The evaluation, in the shape of assessment_schema.Evaluation
+    """
+    questions = section_items(assessment, "multiple_choice")
+    mcq_feedback = grade_multiple_choice(questions, section_answers(user_answers, "multiple_choice", len(questions)))
+    earned = sum(1 for entry in mcq_feedback if entry["correct"])
+    possible = len(mcq_feedback)
+
+    llm_result = llm_result if isinstance(llm_result, dict) else {}
+    grades = {}
+    raw_grades = llm_result.get("grades")
+    for grade in raw_grades if isinstance(raw_grades, list) else []:
+        if isinstance(grade, dict) and "id" in grade:
+            grades[str(grade["id"])] = grade
+    answered = {item["id"] for item in items}
+
+    feedback = {"multiple_choice": mcq_feedback}
+    ungraded = 0
+    for section, weight in FREE_TEXT_WEIGHTS.items():
+        feedback[section] = []
+        for number, _ in enumerate(section_items(assessment, section), start=1):
+            item_id = f"{section}-{number}"
+            if item_id not in answered:
+                feedback[section].append({"question": number, "score": 0, "feedback": "Not answered."})
+                possible += weight
+                continue
+            grade = grades.get(item_id)
+            try:
+                score = max(0.0, min(100.0, float(grade["score"])))
+            except (TypeError, KeyError, ValueError):
+                ungraded += 1
+                feedback[section].append({"question": number, "score": None, "feedback": "Could not be graded automatically."})
+                continue
+            feedback[section].append({"question": number, "score": score, "feedback": grade.get("feedback", "")})
+            earned += weight * score / 100
+            possible += weight
+
+    reflections = section_answers(user_answers, "self_assessment", len(section_items(assessment, "self_assessment")))
+    feedback["self_assessment"] = [
+        {"question": number, "feedback": "Reflection recorded." if answer else "Not answered."}
+        for number, answer in enumerate(reflections, start=1)
+    ]
+
+    strengths = text_list(llm_result.get("strengths"))
+    areas = text_list(llm_result.get("areas_for_improvement"))
+    recommendations = text_list(llm_result.get("recommendations"))
+    if mcq_feedback:
+        correct_count = sum(1 for entry in mcq_feedback if entry["correct"])
+        if correct_count == len(mcq_feedback):
+            strengths.append("All multiple-choice questions answered correctly.")
+        missed = [str(entry["question"]) for entry in mcq_feedback if not entry["correct"]]
+        if missed:
+            areas.append(f"Review the concepts behind multiple-choice question(s) {', '.join(missed)}.")
+    if ungraded:
+        recommendations.append(f"{ungraded} written answer(s) could not be graded automatically; ask a mentor to review them.")
+
+    return Evaluation(
+        round(100 * earned / possible) if possible else 0, feedback, strengths, areas, recommendations
+    ).to_dict()
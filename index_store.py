@@ -0,0 +1,518 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+
+import faiss
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from course_filters import normalize_value, parse_duration_weeks
+from keyword_index import KeywordIndex
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# On-disk layout of a learning path index folder:
+#   index.faiss      - the FAISS index, written with faiss.write_index
+#   docstore.sqlite  - one row per vector: FAISS position, docstore id, text and
+#                      metadata, plus indexed domain/module/duration columns used
+#                      to pre-filter candidates before the vector search
+#   keywords.npz     - BM25 keyword index over the same documents, by FAISS position
+# Nothing is pickled, and documents are read lazily from SQLite. faiss only
+# memory-maps the inverted lists of IVF indexes ("ivf_flat", "ivf_pq"): for those
+# loading is almost free and worker processes on one host share the page cache.
+# Flat and HNSW indexes are still read fully into each process's memory.
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.sqlite"
+KEYWORDS_FILENAME = "keywords.npz"
+# Bump when the on-disk layout changes; older folders are rebuilt
+INDEX_FORMAT_VERSION = 3
+
+# Index folders are published as immutable versions under an index root:
+#   versions/<version>/  - one complete index folder, plus checksums.json and a
+#                          lease file that processes serving the version hold a shared lock on
+#   CURRENT              - the name of the published version
+#   .build.lock          - held (fcntl) by the one process building a new version
+# A version is written under a temporary name, checksummed, renamed into
+# versions/ and then published by atomically replacing CURRENT, so a crash or a
+# concurrent build never leaves readers with a half-written index. Readers
+# load whatever CURRENT names and switch when it changes.
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+LOCK_FILENAME = ".build.lock"
+CHECKSUMS_FILENAME = "checksums.json"
+LEASE_FILENAME = "lease"
+# Published versions kept on disk, on top of those still leased
+DEFAULT_KEEP_VERSIONS = 3
+# Older versions are only deleted once they were superseded this long ago, so a
+# process that read CURRENT just before a publish can still take its lease
+DEFAULT_PRUNE_GRACE_SECONDS = 300
+
+def index_exists(folder):
+    return (
+        os.path.exists(os.path.join(folder, INDEX_FILENAME))
+        and os.path.exists(os.path.join(folder, DOCSTORE_FILENAME))
+    )
+
+def save_index(folder, vectorstore):
+    """
+    Save a LangChain FAISS vector store in the pickle-free format.
+
+    All files are written under temporary names and renamed into place.
+
+    Args:
+        folder (str): The index folder
+        vectorstore (FAISS): The vector store to save
+    """
+    os.makedirs(folder, exist_ok=True)
+    index_path = os.path.join(folder, INDEX_FILENAME)
+    docstore_path = os.path.join(folder, DOCSTORE_FILENAME)
+    keywords_path = os.path.join(folder, KEYWORDS_FILENAME)
+
+    faiss.write_index(vectorstore.index, index_path + ".tmp")
+
+    if os.path.exists(docstore_path + ".tmp"):
+        os.remove(docstore_path + ".tmp")
+    connection = sqlite3.connect(docstore_path + ".tmp")
+    try:
+        connection.execute(
+            "CREATE TABLE documents ("
+            " position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE,"
+            " page_content TEXT NOT NULL, metadata TEXT NOT NULL,"
+            " domain TEXT, module TEXT, min_weeks REAL, max_weeks REAL)"
+        )
+        insert = "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        rows, texts = [], []
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            document = vectorstore.docstore.search(doc_id)
+            texts.append((position, document.page_content))
+            min_weeks, max_weeks = parse_duration_weeks(document.metadata.get("duration"))
+            rows.append((
+                position, doc_id, document.page_content, json.dumps(document.metadata),
+                normalize_value(document.metadata.get("domain", "")),
+                normalize_value(document.metadata.get("module", "")),
+                min_weeks, max_weeks
+            ))
+            if len(rows) >= 10000:
+                connection.executemany(insert, rows)
+                rows = []
+        connection.executemany(insert, rows)
+        # These indexes are the inverted index used by candidate_positions
+        connection.execute("CREATE INDEX documents_domain ON documents (domain)")
+        connection.execute("CREATE INDEX documents_module ON documents (module)")
+        connection.execute("CREATE INDEX documents_min_weeks ON documents (min_weeks)")
+        connection.commit()
+    finally:
+        connection.close()
+
+    # The keyword index is rebuilt from the same documents whenever the vectors are saved
+    KeywordIndex.build(texts).save(keywords_path + ".tmp")
+
+    os.replace(index_path + ".tmp", index_path)
+    os.replace(docstore_path + ".tmp", docstore_path)
+    os.replace(keywords_path + ".tmp", keywords_path)
+
+    # Drop the pickled docstore written by FAISS.save_local in older versions
+    legacy_pickle_path = os.path.join(folder, "index.pkl")
+    if os.path.exists(legacy_pickle_path):
+        os.remove(legacy_pickle_path)
+
+def load_index(folder, embeddings, mmap=True):
+    """
+    Load an index saved with save_index.
+
+    Args:
+        folder (str): The index folder
+        embeddings (Embeddings): Embeddings used for queries
+        mmap (bool): Serve read-only: read documents lazily from SQLite and
+            memory-map the vectors of IVF indexes (other index types are read
+            into memory). Use mmap=False to get a fully in-memory store that
+            can be updated and saved again.
+
+    Returns:
+        FAISS: The LangChain vector store
+    """
+    index_path = os.path.join(folder, INDEX_FILENAME)
+    docstore_path = os.path.join(folder, DOCSTORE_FILENAME)
+
+    if mmap:
+        # IO_FLAG_MMAP is only honoured for IVF inverted lists; don't claim it for other types
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if _is_ivf_index_file(index_path) else 0
+        index = faiss.read_index(index_path, flags)
+        docstore = SQLiteDocstore(docstore_path)
+        return FAISS(embeddings, index, docstore, SQLitePositionMap(docstore))
+
+    index = faiss.read_index(index_path)
+    documents, index_to_docstore_id = {}, {}
+    connection = sqlite3.connect(docstore_path)
+    try:
+        for position, doc_id, page_content, metadata in connection.execute(
+            "SELECT position, doc_id, page_content, metadata FROM documents ORDER BY position"
+        ):
+            documents[doc_id] = Document(page_content=page_content, metadata=json.loads(metadata))
+            index_to_docstore_id[position] = doc_id
+    finally:
+        connection.close()
+    return FAISS(embeddings, index, InMemoryDocstore(documents), index_to_docstore_id)
+
+def _is_ivf_index_file(path):
+    # Every FAISS index file starts with the four-byte code of its index type; IVF codes start with "Iw"
+    with open(path, "rb") as index_file:
+        return index_file.read(4).startswith(b"Iw")
+
+def load_keyword_index(folder):
+    """
+    Load the BM25 keyword index saved next to the vectors.
+
+    Returns:
+        KeywordIndex: The keyword index, or None for folders saved without one
+    """
+    keywords_path = os.path.join(folder, KEYWORDS_FILENAME)
+    if not os.path.exists(keywords_path):
+        return None
+    return KeywordIndex.load(keywords_path)
+
+def current_version(root):
+    """
+    The name of the published index version, or None if nothing has been published.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), encoding="utf-8") as current_file:
+            version = current_file.read().strip()
+    except OSError:
+        return None
+    return version or None
+
+def version_folder(root, version):
+    return os.path.join(root, VERSIONS_DIRNAME, version)
+
+def new_version_folder(root):
+    """
+    Create an empty temporary folder to build a new index version in.
+    """
+    # Names sort in build order, which prune_versions relies on
+    version = f"{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    folder = version_folder(root, f".tmp-{version}")
+    os.makedirs(folder)
+    return folder
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as index_file:
+        for block in iter(lambda: index_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _fsync(path):
+    # Directories can't be opened for fsync on every platform; the data files are what matter
+    try:
+        descriptor = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+def publish_version(root, folder, keep=None):
+    """
+    Checksum a built index folder and publish it as the current version.
+
+    Args:
+        root (str): The index root
+        folder (str): A folder from new_version_folder, with the index saved in it
+        keep (int): Published versions to keep (default: INDEX_KEEP_VERSIONS)
+
+    Returns:
+        str: The published version
+    """
+    # Hashed once here; loads only compare sizes and modification times (see verify_version)
+    checksums = {}
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(folder, name)
+        _fsync(path)
+        stat = os.stat(path)
+        checksums[name] = {"sha256": _file_checksum(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    checksums_path = os.path.join(folder, CHECKSUMS_FILENAME)
+    with open(checksums_path, "w", encoding="utf-8") as checksums_file:
+        json.dump(checksums, checksums_file)
+        checksums_file.flush()
+        os.fsync(checksums_file.fileno())
+
+    version = os.path.basename(folder)[len(".tmp-"):]
+    os.rename(folder, version_folder(root, version))
+    _fsync(os.path.join(root, VERSIONS_DIRNAME))
+
+    current_path = os.path.join(root, CURRENT_FILENAME)
+    with open(current_path + ".tmp", "w", encoding="utf-8") as current_file:
+        current_file.write(version)
+        current_file.flush()
+        os.fsync(current_file.fileno())
+    os.replace(current_path + ".tmp", current_path)
+    _fsync(root)
+
+    prune_versions(root, keep)
+    return version
+
+# Versions never change once published, so each is verified once per process
+_verified_folders = {}
+
+def verify_version(folder, full=False):
+    """
+    Whether the files of an index version are the ones that were published.
+
+    By default only the sizes and modification times are compared, which
+    catches truncated, replaced and half-copied files without reading the
+    index. full=True also compares the SHA-256 of every file (see --verify).
+
+    Args:
+        folder (str): The version folder
+        full (bool): Hash every file
+
+    Returns:
+        bool: Whether the version is intact
+    """
+    key = (folder, full)
+    if key not in _verified_folders:
+        try:
+            with open(os.path.join(folder, CHECKSUMS_FILENAME), encoding="utf-8") as checksums_file:
+                checksums = json.load(checksums_file)
+            intact = True
+            for name, expected in checksums.items():
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime_ns) != (expected["size"], expected["mtime_ns"]):
+                    intact = False
+                elif full and _file_checksum(path) != expected["sha256"]:
+                    intact = False
+                if not intact:
+                    break
+            _verified_folders[key] = intact
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing or malformed checksums (including older builds) mean the version is rebuilt
+            _verified_folders[key] = False
+    return _verified_folders[key]
+
+def prune_versions(root, keep=None, grace_seconds=None):
+    """
+    Delete old published versions no process is serving, and temporary folders of crashed builds.
+
+    A version is deleted when it isn't among the newest keep versions, its
+    lease isn't held (see VersionLease), and it was superseded more than
+    grace_seconds ago. The current version is never deleted. Only call this
+    while holding build_lock, so a build in progress isn't deleted.
+
+    Args:
+        root (str): The index root
+        keep (int): Published versions to keep (default: INDEX_KEEP_VERSIONS)
+        grace_seconds (float): Default INDEX_PRUNE_GRACE_SECONDS
+    """
+    keep = keep or int(os.getenv("INDEX_KEEP_VERSIONS", DEFAULT_KEEP_VERSIONS))
+    if grace_seconds is None:
+        grace_seconds = float(os.getenv("INDEX_PRUNE_GRACE_SECONDS", DEFAULT_PRUNE_GRACE_SECONDS))
+    versions_folder = os.path.join(root, VERSIONS_DIRNAME)
+    current = current_version(root)
+    names = sorted(os.listdir(versions_folder))
+    for name in names:
+        if name.startswith(".tmp-"):
+            shutil.rmtree(os.path.join(versions_folder, name), ignore_errors=True)
+
+    published = [name for name in names if not name.startswith(".tmp-")]
+    now = time.time()
+    for name, successor in zip(published[:-keep], published[1:]):
+        if name == current or now - _published_at(version_folder(root, successor)) < grace_seconds:
+            continue
+        _remove_unleased(version_folder(root, name))
+
+    # Files of the unversioned layout used before versions
+    for name in (INDEX_FILENAME, DOCSTORE_FILENAME, KEYWORDS_FILENAME, "manifest.json", "index.pkl"):
+        if os.path.exists(os.path.join(root, name)):
+            os.remove(os.path.join(root, name))
+
+def _published_at(folder):
+    try:
+        return os.stat(os.path.join(folder, CHECKSUMS_FILENAME)).st_mtime
+    except OSError:
+        return 0.0
+
+def _remove_unleased(folder):
+    if fcntl is None:
+        # Leases can't be checked; the grace period is the only protection
+        shutil.rmtree(folder, ignore_errors=True)
+        return
+    try:
+        lease_file = open(os.path.join(folder, LEASE_FILENAME), "a")
+    except OSError:
+        return
+    with lease_file:
+        try:
+            fcntl.flock(lease_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            print(f' -- Keeping index version "{os.path.basename(folder)}", a process is still serving it.')
+            return
+        # Held while deleting, so a lease taken meanwhile waits and then finds the version gone
+        shutil.rmtree(folder, ignore_errors=True)
+
+class VersionLease:
+    """
+    Shared lock on an index version, held while a process serves from it.
+
+    prune_versions doesn't delete a leased version. The lock is released by
+    release(), or by the operating system when the process exits.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._file = open(os.path.join(folder, LEASE_FILENAME), "a")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_SH)
+        if not os.path.exists(os.path.join(folder, CHECKSUMS_FILENAME)):
+            # Pruned while this lease waited for the lock
+            self.release()
+            raise FileNotFoundError(f"Index version {folder} was removed")
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# flock is per open file, so threads of one process also need a lock of their own
+_thread_build_lock = threading.RLock()
+
+@contextmanager
+def build_lock(root):
+    """
+    Hold the build lock of an index root, so only one process builds at a time.
+
+    Uses fcntl where available; elsewhere only threads of this process are serialised.
+    """
+    os.makedirs(root, exist_ok=True)
+    with _thread_build_lock, open(os.path.join(root, LOCK_FILENAME), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def candidate_positions(docstore, course_filter):
+    """
+    FAISS positions of the courses that match a CourseFilter.
+
+    Args:
+        docstore (SQLiteDocstore): Docstore of a memory-mapped index
+        course_filter (CourseFilter): Domain, module and time budget restrictions
+
+    Returns:
+        np.ndarray: Matching positions (int64)
+    """
+    conditions, parameters = [], []
+    if course_filter.domains:
+        conditions.append(f"domain IN ({','.join('?' * len(course_filter.domains))})")
+        parameters.extend(course_filter.domains)
+    if course_filter.modules:
+        conditions.append(f"module IN ({','.join('?' * len(course_filter.modules))})")
+        parameters.extend(course_filter.modules)
+    if course_filter.max_weeks is not None:
+        conditions.append("(min_weeks IS NULL OR min_weeks <= ?)")
+        parameters.append(course_filter.max_weeks)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = docstore.connection().execute(f"SELECT position FROM documents{where}", parameters).fetchall()
+    return np.fromiter((position for (position,) in rows), dtype=np.int64, count=len(rows))
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only LangChain docstore that fetches documents from docstore.sqlite on demand.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        # SQLite connections can't be shared between threads, so each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+
+    def search(self, search):
+        row = self.connection().execute(
+            "SELECT page_content, metadata FROM documents WHERE doc_id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        raise NotImplementedError("Memory-mapped indexes are read-only; load with mmap=False to update")
+
+    def delete(self, ids):
+        raise NotImplementedError("Memory-mapped indexes are read-only; load with mmap=False to update")
+
+class SQLitePositionMap(Mapping):
+    """
+    Read-only FAISS position -> docstore id mapping backed by docstore.sqlite.
+    """
+
+    def __init__(self, docstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position):
+        row = self.docstore.connection().execute(
+            "SELECT doc_id FROM documents WHERE position = ?", (int(position),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        for (position,) in self.docstore.connection().execute("SELECT position FROM documents ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return self.docstore.connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check published index versions against their checksums.")
+    parser.add_argument("--root", default="faiss_learning_path_index", help="Index root")
+    parser.add_argument("--verify", action="store_true", help="Hash every file (default: compare sizes and times)")
+    parser.add_argument("--all", action="store_true", help="Check every kept version, not just the current one")
+    args = parser.parse_args()
+
+    versions_folder = os.path.join(args.root, VERSIONS_DIRNAME)
+    if args.all and os.path.isdir(versions_folder):
+        versions = [name for name in sorted(os.listdir(versions_folder)) if not name.startswith(".tmp-")]
+    else:
+        versions = [version for version in [current_version(args.root)] if version is not None]
+    if not versions:
+        print(f' -- No published index versions under "{args.root}".')
+        sys.exit(1)
+    failed = 0
+    for version in versions:
+        intact = verify_version(version_folder(args.root, version), full=args.verify)
+        failed += not intact
+        print(f' -- {version}: {"ok" if intact else "CORRUPT"}')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import re
+
+import numpy as np
+
+# BM25 parameters (the usual Okapi defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Rank constant of reciprocal-rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+
+# Keeps technology names such as "node.js", "c++", "c#" and "asp.net" as single tokens
+_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9+#]+)*")
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+class KeywordIndex:
+    """
+    Sparse BM25 index over the course documents, keyed by FAISS position.
+
+    The index is stored as a term-major CSR matrix of precomputed BM25 weights:
+    for term i, postings[indptr[i]:indptr[i + 1]] are the positions containing
+    it and weights[...] their BM25 term scores. A query is scored by summing
+    the weight slices of its terms, so only documents sharing a term are touched.
+    """
+
+    def __init__(self, terms, indptr, postings, weights, size):
+        self.terms = terms
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.size = int(size)
+        self._term_ids = {term: term_id for term_id, term in enumerate(terms.tolist())}
+
+    @classmethod
+    def build(cls, texts_by_position):
+        """
+        Build the index from (position, text) pairs.
+
+        Args:
+            texts_by_position (iterable): (FAISS position, document text) pairs
+
+        Returns:
+            KeywordIndex: The built index
+        """
+        term_postings = {}
+        lengths = {}
+        for position, text in texts_by_position:
+            tokens = tokenize(text)
+            lengths[position] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_postings.setdefault(token, []).append((position, count))
+
+        size = max(lengths) + 1 if lengths else 0
+        document_lengths = np.zeros(size, dtype=np.float32)
+        for position, length in lengths.items():
+            document_lengths[position] = length
+        average_length = float(document_lengths.sum()) / max(1, len(lengths))
+
+        terms = sorted(term_postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings, weights = [], []
+        for term_id, term in enumerate(terms):
+            entries = sorted(term_postings[term])
+            term_positions = np.array([position for position, _ in entries], dtype=np.int32)
+            frequencies = np.array([count for _, count in entries], dtype=np.float32)
+            idf = np.log(1 + (len(lengths) - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * document_lengths[term_positions] / max(average_length, 1e-9))
+            postings.append(term_positions)
+            weights.append((idf * frequencies * (BM25_K1 + 1) / (frequencies + norm)).astype(np.float32))
+            indptr[term_id + 1] = indptr[term_id] + len(entries)
+
+        return cls(
+            np.array(terms, dtype=str),
+            indptr,
+            np.concatenate(postings) if postings else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            size
+        )
+
+    def save(self, path):
+        with open(path, "wb") as index_file:
+            np.savez_compressed(
+                index_file, terms=self.terms, indptr=self.indptr, postings=self.postings,
+                weights=self.weights, size=np.array(self.size)
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["terms"], data["indptr"], data["postings"], data["weights"], data["size"])
+
+    def search(self, query, k, candidate_positions=None):
+        """
+        Rank documents by BM25 score for a query.
+
+        Args:
+            query (str): The query text
+            k (int): Maximum number of results
+            candidate_positions (np.ndarray): Only rank these positions (optional)
+
+        Returns:
+            list: FAISS positions with a positive score, best first
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self._term_ids.get(token)
+            if term_id is not None:
+                start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                scores[self.postings[start:end]] += self.weights[start:end]
+
+        positions = np.arange(self.size) if candidate_positions is None else candidate_positions
+        candidate_scores = scores[positions]
+        matched = np.flatnonzero(candidate_scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-candidate_scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-candidate_scores[matched], kind="stable")]
+        return [int(position) for position in positions[matched]]
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """
+    Merge several rankings of the same items with reciprocal-rank fusion.
+
+    Each item scores sum(1 / (rrf_k + rank)) over the rankings it appears in,
+    so no score calibration between the rankers is needed.
+
+    Args:
+        rankings (list): Lists of items, best first
+        k (int): Number of items to return
+
+    Returns:
+        list: The fused top-k items
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
@@ -0,0 +1,485 @@
+import asyncio
+import inspect
+import json
+import os
+import random
+import re
+import threading
+import time
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# Models tried in order; later ones are fallbacks while the circuit of an earlier one is open
+DEFAULT_MODELS = "gemini-1.5-pro,gemini-pro"
+DEFAULT_TIMEOUT_SECONDS = 60
+DEFAULT_MAX_RETRIES = 3
+# Gemini free tier allows 60 requests per minute per key
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_BURST = 10
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET_SECONDS = 30
+
+class GeminiLLMProvider:
+    """
+    Calls Gemini models through google.generativeai.
+
+    Model objects are created once per model name and share the library's
+    client, so connections are reused across calls.
+    """
+
+    def __init__(self, api_key=None):
+        import google.generativeai as genai
+        from google.api_core import exceptions
+
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.api_key = api_key
+        # JSON mode (response_mime_type) needs google-generativeai 0.5 or later;
+        # older releases rely on the prompt asking for JSON only
+        self._supports_json_mode = "response_mime_type" in inspect.signature(genai.GenerationConfig).parameters
+        self._models = {}
+        self._lock = threading.Lock()
+        # 429s, 5xx and deadlines are worth retrying; bad requests are not
+        self._retryable_errors = (
+            exceptions.TooManyRequests,
+            exceptions.ServerError,
+            exceptions.DeadlineExceeded,
+            TimeoutError,
+            asyncio.TimeoutError,
+            ConnectionError,
+        )
+
+    def generate(self, model, prompt, temperature, timeout, json_mode=False):
+        response = self._model(model).generate_content(
+            prompt,
+            generation_config=self._generation_config(temperature, json_mode),
+            request_options={"timeout": timeout}
+        )
+        return response.text
+
+    def stream(self, model, prompt, temperature, timeout, json_mode=False):
+        response = self._model(model).generate_content(
+            prompt,
+            generation_config=self._generation_config(temperature, json_mode),
+            stream=True,
+            request_options={"timeout": timeout}
+        )
+        for chunk in response:
+            yield self._chunk_text(chunk)
+
+    async def agenerate(self, model, prompt, temperature, timeout, json_mode=False):
+        response = await asyncio.wait_for(
+            self._model(model).generate_content_async(
+                prompt,
+                generation_config=self._generation_config(temperature, json_mode),
+                request_options={"timeout": timeout}
+            ),
+            timeout
+        )
+        return response.text
+
+    async def astream(self, model, prompt, temperature, timeout, json_mode=False):
+        response = await asyncio.wait_for(
+            self._model(model).generate_content_async(
+                prompt,
+                generation_config=self._generation_config(temperature, json_mode),
+                stream=True,
+                request_options={"timeout": timeout}
+            ),
+            timeout
+        )
+        async for chunk in response:
+            yield self._chunk_text(chunk)
+
+    def is_retryable(self, error):
+        return isinstance(error, self._retryable_errors)
+
+    def _generation_config(self, temperature, json_mode):
+        config = {"temperature": temperature}
+        if json_mode and self._supports_json_mode:
+            config["response_mime_type"] = "application/json"
+        return config
+
+    def _model(self, model):
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = self._genai.GenerativeModel(model)
+            return self._models[model]
+
+    @staticmethod
+    def _chunk_text(chunk):
+        # Chunks without text parts (e.g. only safety ratings) raise on .text
+        return "".join(part.text for part in chunk.parts if getattr(part, "text", None))
+
+class StubLLMProvider:
+    """
+    Offline LLM that answers instantly (or after a configurable delay) with canned text.
+
+    Assessment and evaluation prompts get well-formed JSON in the shape the
+    app expects, so the whole flow works without network access. Use it for
+    local development and load tests (LLM_PROVIDER=stub). Set
+    LLM_STUB_LATENCY_SECONDS to simulate model latency and
+    LLM_STUB_FAILURE_RATE to inject retryable errors.
+    """
+
+    api_key = "stub"
+
+    def __init__(self, latency=None, failure_rate=None):
+        self.latency = float(os.getenv("LLM_STUB_LATENCY_SECONDS", "0") if latency is None else latency)
+        self.failure_rate = float(os.getenv("LLM_STUB_FAILURE_RATE", "0") if failure_rate is None else failure_rate)
+
+    def generate(self, model, prompt, temperature, timeout, json_mode=False):
+        self._sleep(timeout, time.sleep)
+        return self._respond(prompt)
+
+    def stream(self, model, prompt, temperature, timeout, json_mode=False):
+        self._sleep(timeout, time.sleep)
+        yield from self._chunks(self._respond(prompt))
+
+    async def agenerate(self, model, prompt, temperature, timeout, json_mode=False):
+        await self._asleep(timeout)
+        return self._respond(prompt)
+
+    async def astream(self, model, prompt, temperature, timeout, json_mode=False):
+        await self._asleep(timeout)
+        for chunk in self._chunks(self._respond(prompt)):
+            yield chunk
+
+    def is_retryable(self, error):
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+    def _sleep(self, timeout, sleep):
+        sleep(min(self.latency, timeout))
+        self._check(timeout)
+
+    async def _asleep(self, timeout):
+        await asyncio.sleep(min(self.latency, timeout))
+        self._check(timeout)
+
+    def _check(self, timeout):
+        if self.latency > timeout:
+            raise TimeoutError(f"Stub LLM call exceeded {timeout}s")
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError("Injected stub LLM failure")
+
+    @staticmethod
+    def _chunks(text, size=80):
+        for start in range(0, len(text), size):
+            yield text[start:start + size]
+
+    @staticmethod
+    def _respond(prompt):
+        # The assessment prompt lists the topics as "- ..." lines after this heading
+        topics_block = re.search(r"following topics/learning paths:\s*\n((?:[ \t]*- .+\n?)+)", prompt)
+        topics = re.findall(r"- (.+)", topics_block.group(1)) if topics_block else ["the learning path"]
+        if "assessment creator" in prompt:
+            # Distinct wording per call, so repeated requests add new questions
+            variant = random.randrange(1000, 10000)
+            return json.dumps({
+                "multiple_choice": [
+                    {
+                        "question": f"Which statement best describes {topic}? (#{variant}-{number})",
+                        "options": ["The correct definition", "A related idea", "An unrelated idea", "None of these"],
+                        "correct_answer": "A",
+                    }
+                    for number, topic in enumerate((topics * 5)[:5], start=1)
+                ],
+                "short_answer": [
+                    {"question": f"Explain key concept {number} of {topic} (#{variant}).", "guidance": "Define it and give an example."}
+                    for number, topic in enumerate((topics * 3)[:3], start=1)
+                ],
+                "practical_exercise": [
+                    {
+                        "title": f"Apply {topics[0]}",
+                        "description": f"Build a small project that uses {topics[0]}.",
+                        "steps": ["Set up the project", "Implement the core feature", "Write a short README"],
+                        "criteria": ["Correctness", "Clarity"],
+                    }
+                ],
+                "self_assessment": [
+                    "Which topic was hardest for you, and why?",
+                    "How would you explain what you learned to a friend?",
+                    "What will you practise next?",
+                ],
+            }, indent=2)
+        graded_ids = re.findall(r"^\[([a-z_]+-\d+)\]$", prompt, re.MULTILINE)
+        if "assessment evaluator" in prompt and graded_ids:
+            return json.dumps({
+                "grades": [
+                    {"id": item_id, "score": 75, "feedback": "A sound answer; add a concrete example."}
+                    for item_id in graded_ids
+                ],
+                "strengths": ["Clear written explanations"],
+                "areas_for_improvement": ["Support answers with examples"],
+                "recommendations": ["Build a small project that applies the concepts"],
+            }, indent=2)
+        if "assessment evaluator" in prompt:
+            return json.dumps({
+                "score": 70,
+                "feedback": {"multiple_choice": [], "short_answer": [], "practical_exercise": [], "self_assessment": []},
+                "strengths": ["Good grasp of the fundamentals"],
+                "areas_for_improvement": ["Practise applying the concepts"],
+                "recommendations": ["Review the course material and build a small project"],
+            }, indent=2)
+        return (
+            "This learning path introduces the core ideas of the field and why they matter. "
+            "Start with the fundamentals, practise with small projects, and build up to the advanced courses. "
+            "Basic computer literacy is enough to begin. Progress takes steady effort, but every course builds on the last."
+        )
+
+def create_llm_provider(provider_name=None, api_key=None):
+    """
+    Create the LLM provider selected by name or by the LLM_PROVIDER variable.
+
+    Args:
+        provider_name (str): "gemini" (default) or "stub"
+        api_key (str): Gemini API key
+
+    Returns:
+        An object with generate/stream/agenerate/astream(model, prompt,
+        temperature, timeout, json_mode), is_retryable(error) and an api_key
+    """
+    provider_name = (provider_name or os.getenv("LLM_PROVIDER", "gemini")).lower()
+    if provider_name == "gemini":
+        return GeminiLLMProvider(api_key=api_key)
+    if provider_name == "stub":
+        return StubLLMProvider()
+    raise ValueError(f"Unknown LLM provider: {provider_name}")
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: rate tokens per second, bursts of up to capacity.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # Take a token now, possibly going negative; returns how long the caller must wait
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Stops calling a model after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are refused for reset_seconds. Then one trial call is let through: if it
+    succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+# Shared by every gateway in the process: one bucket per API key, one breaker per model
+_buckets = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+def _token_bucket(api_key):
+    with _registry_lock:
+        if api_key not in _buckets:
+            rate = float(os.getenv("LLM_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)) / 60
+            _buckets[api_key] = TokenBucket(rate, int(os.getenv("LLM_BURST", DEFAULT_BURST)))
+        return _buckets[api_key]
+
+def _circuit_breaker(model):
+    with _registry_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(
+                int(os.getenv("LLM_BREAKER_FAILURES", DEFAULT_BREAKER_FAILURES)),
+                float(os.getenv("LLM_BREAKER_RESET_SECONDS", DEFAULT_BREAKER_RESET_SECONDS))
+            )
+        return _breakers[model]
+
+class LLMGateway:
+    """
+    Shared entry point for every LLM call in the app.
+
+    It has the invoke/stream/ainvoke/astream interface of a LangChain chat
+    model, so the recommendation and assessment models use it unchanged.
+    Every attempt waits for the per-API-key token bucket and has a timeout.
+    Rate limiting (429), server errors (5xx) and timeouts are retried with
+    jittered exponential backoff. A model whose retries are exhausted counts
+    as a failure for its circuit breaker, and the next model is tried.
+    Streams are only retried before their first chunk.
+    """
+
+    def __init__(self, temperature=0.7, models=None, provider=None, timeout=None, max_retries=None, json_mode=False):
+        self.temperature = temperature
+        self.json_mode = json_mode
+        self.models = models or [
+            model.strip() for model in os.getenv("LLM_MODELS", DEFAULT_MODELS).split(",") if model.strip()
+        ]
+        self.provider = provider or create_llm_provider()
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)) if max_retries is None else max_retries
+        self._bucket = _token_bucket(self.provider.api_key)
+
+    def invoke(self, prompt):
+        return AIMessage(content=self._call(lambda model: self.provider.generate(model, prompt, self.temperature, self.timeout, self.json_mode)))
+
+    def stream(self, prompt):
+        def start(model):
+            # Pull the first chunk inside the retry loop, so connection errors are retried
+            chunks = self.provider.stream(model, prompt, self.temperature, self.timeout, self.json_mode)
+            return next(chunks, None), chunks
+
+        first, chunks = self._call(start)
+        if first is None:
+            return
+        yield AIMessageChunk(content=first)
+        for chunk in chunks:
+            yield AIMessageChunk(content=chunk)
+
+    async def ainvoke(self, prompt):
+        text = await self._acall(lambda model: self.provider.agenerate(model, prompt, self.temperature, self.timeout, self.json_mode))
+        return AIMessage(content=text)
+
+    async def astream(self, prompt):
+        async def start(model):
+            chunks = self.provider.astream(model, prompt, self.temperature, self.timeout, self.json_mode)
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return None, chunks
+
+        first, chunks = await self._acall(start)
+        if first is None:
+            return
+        yield AIMessageChunk(content=first)
+        async for chunk in chunks:
+            yield AIMessageChunk(content=chunk)
+
+    def _unavailable(self, last_error):
+        if last_error is not None:
+            return last_error
+        return RuntimeError(f"All LLM models are unavailable (circuit open): {', '.join(self.models)}")
+
+    def _call(self, attempt_fn):
+        last_error = None
+        for model in self.models:
+            breaker = _circuit_breaker(model)
+            if not breaker.allow():
+                continue
+            for attempt in range(self.max_retries + 1):
+                self._bucket.acquire()
+                try:
+                    result = attempt_fn(model)
+                    breaker.record_success()
+                    return result
+                except Exception as e:
+                    last_error = e
+                    if not self.provider.is_retryable(e):
+                        # The model answered (e.g. a bad request), so it is not unavailable
+                        breaker.record_success()
+                        raise
+                    if attempt < self.max_retries:
+                        delay = self._backoff(attempt)
+                        print(f' -- LLM call to "{model}" failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.')
+                        time.sleep(delay)
+            breaker.record_failure()
+            print(f' -- LLM model "{model}" failed {self.max_retries + 1} times, trying the next model.')
+        raise self._unavailable(last_error)
+
+    async def _acall(self, attempt_fn):
+        last_error = None
+        for model in self.models:
+            breaker = _circuit_breaker(model)
+            if not breaker.allow():
+                continue
+            for attempt in range(self.max_retries + 1):
+                await self._bucket.aacquire()
+                try:
+                    result = await attempt_fn(model)
+                    breaker.record_success()
+                    return result
+                except Exception as e:
+                    last_error = e
+                    if not self.provider.is_retryable(e):
+                        # The model answered (e.g. a bad request), so it is not unavailable
+                        breaker.record_success()
+                        raise
+                    if attempt < self.max_retries:
+                        delay = self._backoff(attempt)
+                        print(f' -- LLM call to "{model}" failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.')
+                        await asyncio.sleep(delay)
+            breaker.record_failure()
+            print(f' -- LLM model "{model}" failed {self.max_retries + 1} times, trying the next model.')
+        raise self._unavailable(last_error)
+
+    @staticmethod
+    def _backoff(attempt):
+        # Exponential backoff with full jitter, capped at 30 seconds
+        return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+def get_llm(temperature=0.7, json_mode=False):
+    """
+    Return the process-wide gateway for a sampling temperature, creating it on first use.
+
+    Args:
+        temperature (float): Sampling temperature
+        json_mode (bool): Ask the model for JSON output where the SDK supports it
+
+    Returns:
+        LLMGateway: The shared gateway
+    """
+    key = (temperature, json_mode)
+    with _gateways_lock:
+        if key not in _gateways:
+            _gateways[key] = LLMGateway(temperature=temperature, json_mode=json_mode)
+        return _gateways[key]
@@ -1,14 +1,34 @@
+import asyncio
+import csv
+import hashlib
+import json
 import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain.document_loaders import TextLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_core.embeddings import Embeddings
-from langchain.chains import RetrievalQA
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 from google.generativeai import configure
 from dotenv import load_dotenv
+from ann_index import (
+    AnnIndexConfig, as_float32_matrix, configure_search, create_index, needs_upgrade, search_candidates,
+    supports_positional_removal
+)
+from course_filters import CourseFilter, parse_duration_weeks
+from embedding_backend import CachedEmbeddings, GeminiEmbeddings
+from index_store import (
+    INDEX_FORMAT_VERSION, SQLiteDocstore, VersionLease, build_lock, candidate_positions, current_version, index_exists, load_index,
+    load_keyword_index, new_version_folder, publish_version, save_index, verify_version, version_folder
+)
+from keyword_index import reciprocal_rank_fusion
+from llm_gateway import get_llm
+from response_cache import ResponseCache
+from singleflight import AsyncSingleFlight, SingleFlight
+from token_budget import pack_documents
 
 # Load environment variables from .env file
 load_dotenv('new.env')
@@ -16,87 +36,406 @@ load_dotenv('new.env')
 # Configure Google Generative AI with your API key
 configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-# Custom GeminiEmbeddings class inheriting from Embeddings
-class GeminiEmbeddings(Embeddings):
-    def __init__(self, api_key, request_timeout=60):
-        self.api_key = api_key
-        self.request_timeout = request_timeout
+# CSV column -> metadata key kept on every course document
+CSV_METADATA_COLUMNS = {
+    "Learning Pathway": "learning_pathway",
+    "Duration": "duration",
+    "Link": "link",
+    "Module": "module",
+    "Domain": "domain",
+}
 
-    def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        # Replace with actual Gemini API call for document embeddings
-        return [[-1.0] * 512 for _ in range(len(texts))]  # Return dummy embeddings of correct shape
+# Number of course rows retrieved as context for each query (the prompt asks for 7-8 table rows)
+RETRIEVER_TOP_K = 8
 
-    def embed_query(self, text: str) -> list[float]:
-        # Replace with actual Gemini API call for query embeddings
-        return [-1.0] * 512  # Return dummy embedding of correct shape
+# With the keyword index, the dense and BM25 rankings are each this many times
+# deeper than RETRIEVER_TOP_K before they are fused
+HYBRID_RANK_DEPTH_FACTOR = 4
+
+# How the recommendation is written:
+#   "llm"        - the LLM writes the introduction and re-types the course table
+#   "structured" - the table is rendered from the retrieved rows; the LLM only writes the introduction
+#   "template"   - no LLM call at all; the introduction is a filled-in template
+RECOMMENDATION_MODES = ("llm", "structured", "template")
+
+# Columns of the course table, as parsed by app_new.process_recommendation
+COURSE_TABLE_COLUMNS = (
+    ("Learning Pathway", "learning_pathway"),
+    ("duration", "duration"),
+    ("link", "link"),
+    ("Module", "module"),
+)
+
+_COURSE_TABLE_HEADER_PATTERN = re.compile(
+    r"\|\s*" + r"\s*\|\s*".join(re.escape(header) for header, _ in COURSE_TABLE_COLUMNS) + r"\s*\|"
+)
+
+# Number of LLM calls a batch recommendation runs at the same time
+BATCH_LLM_CONCURRENCY = int(os.getenv("RECOMMEND_BATCH_CONCURRENCY", "8"))
+
+# Number of course rows embedded and added to the index at a time; GeminiEmbeddings
+# splits each of these into concurrent API batches
+INDEX_BATCH_SIZE = 1000
+
+# Root of the published FAISS index versions (see index_store)
+FAISS_INDEX_ROOT = "faiss_learning_path_index"
+
+def iter_csv_documents(data_path):
+    """
+    Stream the learning path CSV file as one document per course row.
+
+    Rows are read one at a time, so memory use does not grow with the size of the file.
+
+    Args:
+        data_path (str): Path to the learning path CSV file
+
+    Yields:
+        Document: A course row, with the CSV columns as metadata
+    """
+    with open(data_path, newline="", encoding="utf-8-sig") as csv_file:
+        for row in csv.DictReader(csv_file):
+            metadata = {
+                key: (row.get(column) or "").strip()
+                for column, key in CSV_METADATA_COLUMNS.items()
+            }
+            if not any(metadata.values()):
+                continue
+            page_content = "\n".join(
+                f"{column}: {metadata[key]}" for column, key in CSV_METADATA_COLUMNS.items()
+            )
+            yield Document(page_content=page_content, metadata=metadata)
+
+def render_course_table(documents):
+    """
+    Render retrieved course rows as the markdown table shown to the learner.
+
+    Rows keep the retrieval order (best match first), so the same query over
+    the same index always gives the same table.
+
+    Args:
+        documents (list): Retrieved course documents
+
+    Returns:
+        str: The markdown table
+    """
+    lines = [
+        "| " + " | ".join(header for header, _ in COURSE_TABLE_COLUMNS) + " |",
+        "| " + " | ".join("---" for _ in COURSE_TABLE_COLUMNS) + " |",
+    ]
+    for document in documents:
+        cells = [
+            str(document.metadata.get(key, "")).replace("|", "\\|").replace("\n", " ").strip()
+            for _, key in COURSE_TABLE_COLUMNS
+        ]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def split_recommendation(recommendation_text):
+    """
+    Split a recommendation into its introduction and its course table.
+
+    Args:
+        recommendation_text (str): Introduction followed by the markdown table
+
+    Returns:
+        tuple: (path_introduction, path_content); path_content is "" if there is no table
+    """
+    match = _COURSE_TABLE_HEADER_PATTERN.search(recommendation_text)
+    if match is None:
+        return recommendation_text, ""
+    header = "| " + " | ".join(header for header, _ in COURSE_TABLE_COLUMNS) + " |"
+    return (
+        recommendation_text[:match.start()].strip(),
+        header + "\n" + recommendation_text[match.end():].strip()
+    )
+
+def template_introduction(documents):
+    """
+    Introductory paragraph built from the retrieved rows, without an LLM call.
+
+    Args:
+        documents (list): Retrieved course documents
+
+    Returns:
+        str: The introduction
+    """
+    if not documents:
+        return "We couldn't find courses in the catalog that match your request. Try a different category or more available time."
+    domains = list(dict.fromkeys(document.metadata.get("domain") for document in documents if document.metadata.get("domain")))
+    modules = list(dict.fromkeys(document.metadata.get("module") for document in documents if document.metadata.get("module")))
+    durations = [parse_duration_weeks(document.metadata.get("duration")) for document in documents]
+    durations = [duration for duration in durations if duration[0] is not None]
+
+    introduction = f"Here is a learning path of {len(documents)} courses"
+    if domains:
+        introduction += f" in {', '.join(domains)}"
+    introduction += "."
+    if modules:
+        introduction += f" It covers {', '.join(modules[:5])}."
+    if durations:
+        low = sum(duration[0] for duration in durations)
+        high = sum(duration[1] for duration in durations)
+        total = f"{low:.0f}" if round(low) == round(high) else f"{low:.0f}-{high:.0f}"
+        introduction += f" Taken one after another, the courses add up to about {total} weeks of study."
+    introduction += (
+        " Work through them in the order listed, finish the hands-on exercises in each course"
+        " before moving on, and revisit earlier topics whenever a later course builds on them."
+    )
+    return introduction
+
+# Runs the BM25 searches alongside query embedding and the FAISS search
+_keyword_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="keyword-search")
+
+# Runs the parts of a recommendation (introduction, retrieval and table) side by side
+_pipeline_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="recommendation-pipeline")
 
 class GenerateLearningPathIndexEmbeddings:
     def __init__(self, csv_filename="one.csv"):
+        # Only the Gemini embedding provider needs the key; it raises if the key is missing
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not self.gemini_api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-            
+
         self.data_path = os.path.join(os.getcwd(), csv_filename)
         if not os.path.exists(self.data_path):
             raise FileNotFoundError(f"CSV file not found at {self.data_path}")
             
-        self.our_custom_data = None
+        self.document_ids = None
+        self.ann_config = AnnIndexConfig.from_env()
         self.gemini_embeddings = None
         self.faiss_vectorstore = None
+        self.keyword_index = None
+        self.index_version = None
+        self.index_lease = None
 
         self.load_csv_data()
         self.get_gemini_embeddings()
         self.create_faiss_vectorstore_with_csv_data_and_gemini_embeddings()
 
     def load_csv_data(self):
-        print(' -- Started loading .csv file for chunking purposes.')
-        loader = TextLoader(self.data_path)
-        document = loader.load()
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=30, separator="\n")
-        self.our_custom_data = text_splitter.split_documents(document)
-        print(f' -- Finished splitting text from the .csv file ({self.data_path}).')
+        # Only the content hashes are kept in memory; rows are streamed again when they need embedding
+        print(' -- Started reading course rows from the .csv file.')
+        document_ids = {}
+        for document in iter_csv_documents(self.data_path):
+            document_ids.setdefault(self._document_id(document), None)
+        self.document_ids = list(document_ids)
+        print(f' -- Finished reading {len(self.document_ids)} course rows from the .csv file ({self.data_path}).')
+
+    def iter_document_batches(self, wanted_ids, batch_size=INDEX_BATCH_SIZE):
+        """
+        Stream the course documents whose ids are in wanted_ids, in batches.
+
+        Args:
+            wanted_ids (set): Content hashes of the rows to return
+            batch_size (int): Maximum number of documents per batch
+
+        Yields:
+            tuple: (ids, documents) for each batch
+        """
+        seen_ids = set()
+        batch_ids, batch_documents = [], []
+        for document in iter_csv_documents(self.data_path):
+            doc_id = self._document_id(document)
+            if doc_id not in wanted_ids or doc_id in seen_ids:
+                continue
+            seen_ids.add(doc_id)
+            batch_ids.append(doc_id)
+            batch_documents.append(document)
+            if len(batch_ids) >= batch_size:
+                yield batch_ids, batch_documents
+                batch_ids, batch_documents = [], []
+        if batch_ids:
+            yield batch_ids, batch_documents
 
     def get_gemini_embeddings(self):
-        self.gemini_embeddings = GeminiEmbeddings(api_key=self.gemini_api_key, request_timeout=60)
+        # Cache vectors on disk so unchanged rows and repeated queries are not embedded again
+        self.gemini_embeddings = CachedEmbeddings(
+            GeminiEmbeddings(api_key=self.gemini_api_key, request_timeout=60)
+        )
 
     def create_faiss_vectorstore_with_csv_data_and_gemini_embeddings(self):
-        faiss_vectorstore_foldername = "faiss_learning_path_index"
-        csv_last_modified = datetime.fromtimestamp(os.path.getmtime(self.data_path))
-        index_last_modified = None
-
-        if os.path.exists(faiss_vectorstore_foldername):
-            index_last_modified = datetime.fromtimestamp(os.path.getmtime(faiss_vectorstore_foldername))
-
-        if not os.path.exists(faiss_vectorstore_foldername) or csv_last_modified > index_last_modified:
-            print(' -- Creating a new FAISS vector store from chunked text and Gemini embeddings.')
-            vectorstore = FAISS.from_documents(self.our_custom_data, self.gemini_embeddings)
-            vectorstore.save_local(faiss_vectorstore_foldername)
-            print(f' -- Saved the newly created FAISS vector store at "{faiss_vectorstore_foldername}".')
+        # The index is published as immutable versions. A stale index is rebuilt under the
+        # build lock into a new version, which readers switch to once it is published;
+        # until then every process keeps serving the previous version.
+        version = current_version(FAISS_INDEX_ROOT)
+        if self._is_stale(version):
+            with build_lock(FAISS_INDEX_ROOT):
+                # Another process may have published a fresh version while this one waited
+                version = current_version(FAISS_INDEX_ROOT)
+                if self._is_stale(version):
+                    version = self._build_version(version)
         else:
-            print(f' -- Found existing FAISS vector store at "{faiss_vectorstore_foldername}", loading from cache.')
-        
-        # Try to load the FAISS index with the parameter, if it fails, try without it
+            print(f' -- Found existing FAISS vector store version "{version}", loading from cache.')
+
+        # Serve read-only; IVF indexes are memory-mapped, so their cold start doesn't read the whole file
+        folder = version_folder(FAISS_INDEX_ROOT, version)
+        self.index_version = version
+        # Held while the version is served, so no other process prunes it meanwhile
+        self.index_lease = VersionLease(folder)
+        self.faiss_vectorstore = load_index(folder, self.gemini_embeddings, mmap=True)
+        configure_search(self.faiss_vectorstore.index, self.ann_config)
+        self.keyword_index = load_keyword_index(folder)
+
+    def _is_compatible(self, manifest):
+        return (manifest is not None
+                and manifest.get("format") == INDEX_FORMAT_VERSION
+                and manifest.get("embedding_model") == self.gemini_embeddings.model
+                and manifest.get("index") == self.ann_config.build_params())
+
+    def _is_stale(self, version):
+        manifest = self._load_manifest(version)
+        return not self._is_compatible(manifest) or set(manifest["documents"]) != set(self.document_ids)
+
+    def _build_version(self, version):
+        """
+        Build a new index version in a temporary folder and publish it.
+
+        Args:
+            version (str): The published version to update, or None
+
+        Returns:
+            str: The new version
+        """
+        # Every row is identified by the hash of its content, so duplicate rows collapse into one entry
+        manifest = self._load_manifest(version)
+        folder = new_version_folder(FAISS_INDEX_ROOT)
         try:
-            self.faiss_vectorstore = FAISS.load_local(
-                faiss_vectorstore_foldername, 
-                self.gemini_embeddings,
-                allow_dangerous_deserialization=True
-            )
-        except TypeError:
-            # If the above fails due to the parameter not being supported, try without it
-            print(' -- Parameter allow_dangerous_deserialization not supported, loading without it.')
-            self.faiss_vectorstore = FAISS.load_local(
-                faiss_vectorstore_foldername, 
-                self.gemini_embeddings
-            )
+            if not self._is_compatible(manifest):
+                self._build_full_index(folder)
+            else:
+                indexed_ids = set(manifest["documents"])
+                current_ids = set(self.document_ids)
+                added_ids = [doc_id for doc_id in self.document_ids if doc_id not in indexed_ids]
+                removed_ids = [doc_id for doc_id in manifest["documents"] if doc_id not in current_ids]
+                self.faiss_vectorstore = load_index(
+                    version_folder(FAISS_INDEX_ROOT, version), self.gemini_embeddings, mmap=False
+                )
+                if removed_ids and not supports_positional_removal(self.faiss_vectorstore.index):
+                    print(f' -- {len(removed_ids)} rows removed and the "{self.ann_config.index_type}" index cannot drop them in place.')
+                    self._build_full_index(folder)
+                elif needs_upgrade(self.faiss_vectorstore.index, self.ann_config, len(current_ids)):
+                    print(f' -- {len(current_ids)} rows are enough to train the "{self.ann_config.index_type}" index; rebuilding it.')
+                    self._build_full_index(folder)
+                else:
+                    # Only rows that were added, changed or deleted are (re-)embedded or removed
+                    print(f' -- Updating FAISS vector store: {len(added_ids)} added, {len(removed_ids)} removed.')
+                    if removed_ids:
+                        self.faiss_vectorstore.delete(removed_ids)
+                    for batch_ids, batch_documents in self.iter_document_batches(set(added_ids)):
+                        self.faiss_vectorstore.add_documents(batch_documents, ids=batch_ids)
+                    self._save_vectorstore(folder)
+        except BaseException:
+            # Nothing was published, so readers never see the partial build
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+        version = publish_version(FAISS_INDEX_ROOT, folder)
+        print(f' -- Published FAISS vector store version "{version}".')
+        return version
+
+    def _build_full_index(self, faiss_vectorstore_foldername):
+        """
+        Embed every course row and build the configured FAISS index type from scratch.
+
+        IVF indexes are trained on the first ann_config.training_size vectors,
+        which are held in memory until training; the remaining rows are
+        streamed straight into the trained index.
+        """
+        if not self.document_ids:
+            raise ValueError(f"No course rows found in {self.data_path}")
+        print(f' -- Creating a new "{self.ann_config.index_type}" FAISS vector store from course rows and Gemini embeddings.')
+        self.faiss_vectorstore = None
+        pending_batches, pending_count = [], 0
+        for batch_ids, batch_documents in self.iter_document_batches(set(self.document_ids)):
+            vectors = self.gemini_embeddings.embed_documents([document.page_content for document in batch_documents])
+            if self.faiss_vectorstore is not None:
+                self._add_embedded_batch(batch_ids, batch_documents, vectors)
+                continue
+            pending_batches.append((batch_ids, batch_documents, vectors))
+            pending_count += len(vectors)
+            if not self.ann_config.needs_training() or pending_count >= self.ann_config.training_size:
+                self._create_trained_vectorstore(pending_batches)
+                pending_batches = []
+        if self.faiss_vectorstore is None:
+            self._create_trained_vectorstore(pending_batches)
+        self._save_vectorstore(faiss_vectorstore_foldername)
+
+    def _create_trained_vectorstore(self, embedded_batches):
+        training_vectors = as_float32_matrix(
+            [vector for _, _, vectors in embedded_batches for vector in vectors][:self.ann_config.training_size]
+        )
+        index = create_index(self.ann_config, training_vectors)
+        self.faiss_vectorstore = FAISS(self.gemini_embeddings, index, InMemoryDocstore({}), {})
+        for batch_ids, batch_documents, vectors in embedded_batches:
+            self._add_embedded_batch(batch_ids, batch_documents, vectors)
+
+    def _add_embedded_batch(self, batch_ids, batch_documents, vectors):
+        self.faiss_vectorstore.add_embeddings(
+            zip([document.page_content for document in batch_documents], vectors),
+            metadatas=[document.metadata for document in batch_documents],
+            ids=batch_ids
+        )
+
+    @staticmethod
+    def _document_id(document):
+        return hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _manifest_path(faiss_vectorstore_foldername):
+        return os.path.join(faiss_vectorstore_foldername, "manifest.json")
+
+    def _load_manifest(self, version):
+        """
+        Load the sidecar manifest listing the content hashes stored in an index version.
+
+        Returns:
+            dict: The manifest, or None if there is no usable index to update
+        """
+        if version is None:
+            return None
+        faiss_vectorstore_foldername = version_folder(FAISS_INDEX_ROOT, version)
+        manifest_path = self._manifest_path(faiss_vectorstore_foldername)
+        if not index_exists(faiss_vectorstore_foldername) or not os.path.exists(manifest_path):
+            return None
+        if not verify_version(faiss_vectorstore_foldername):
+            print(f' -- FAISS vector store version "{version}" failed its checksum check, rebuilding.')
+            return None
+        try:
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError) as e:
+            print(f' -- Ignoring unreadable index manifest ({e}).')
+            return None
+
+    def _save_vectorstore(self, faiss_vectorstore_foldername):
+        save_index(faiss_vectorstore_foldername, self.faiss_vectorstore)
+
+        # Written last; the version is only published once it is complete
+        manifest = {
+            "format": INDEX_FORMAT_VERSION,
+            "csv_path": self.data_path,
+            "embedding_model": self.gemini_embeddings.model,
+            "index": self.ann_config.build_params(),
+            "documents": self.document_ids,
+        }
+        manifest_path = self._manifest_path(faiss_vectorstore_foldername)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        print(f' -- Saved the FAISS vector store at "{faiss_vectorstore_foldername}" ({len(self.document_ids)} documents).')
 
     def get_faiss_vector_store(self):
         return self.faiss_vectorstore
 
+    def get_keyword_index(self):
+        return self.keyword_index
+
 class GenAILearningPathIndex:
-    def __init__(self, faiss_vectorstore):
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+    def __init__(self, faiss_vectorstore, llm=None, ann_config=None, keyword_index=None, mode=None):
+        self.mode = (mode or os.getenv("RECOMMENDATION_MODE", "structured")).lower()
+        if self.mode not in RECOMMENDATION_MODES:
+            raise ValueError(f"Unknown recommendation mode {self.mode!r}; expected one of {', '.join(RECOMMENDATION_MODES)}")
         self.faiss_vectorstore = faiss_vectorstore
+        # Without a keyword index, retrieval is dense only
+        self.keyword_index = keyword_index
+        self.ann_config = ann_config if ann_config is not None else AnnIndexConfig.from_env()
 
         # Updated prompt template to include an introductory paragraph
         prompt_template = (
@@ -118,7 +457,7 @@ class GenAILearningPathIndex:
                | ... | ... | ... | ... |
                
             It must contain a link for each line of the result in a table.
-            Consider the duration and Module information mentioned in the question.
+            The rows below are already restricted to the requested domain and time budget.
             If you don't know the answer, don't make an entry in the table.
             
             {context}
@@ -127,59 +466,928 @@ class GenAILearningPathIndex:
             """
         )
         self.PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-        
-        # Updated to use the current Gemini model name
+
+        # In "structured" mode the table is rendered from the rows, so the LLM only writes the introduction.
+        # It depends on the query alone, so it is generated while the courses are retrieved.
+        introduction_template = (
+            """
+            You are an expert education advisor. Write a comprehensive introductory paragraph for the query below that:
+               - Introduces the topic/field being asked about
+               - Explains why this field is important or relevant
+               - Provides general guidance on how to approach learning this topic
+               - Mentions any prerequisites or foundational knowledge needed
+               - Offers encouragement and realistic expectations about the learning journey
+               - just cover all in small 5-6 sentence paragraph
+
+            Only write the paragraph; the recommended courses are shown to the learner separately.
+
+            Question: {question}
+            """
+        )
+        self.INTRODUCTION_PROMPT = PromptTemplate(template=introduction_template, input_variables=["question"])
+
+        # The shared gateway handles rate limiting, retries and model fallback
+        self.llm = llm if llm is not None or self.mode == "template" else get_llm(temperature=1.0)
+
+    def get_response_for(self, query: str, course_filter=None):
+        return self.generate_response(query, course_filter)[0]
+
+    def generate_response(self, query: str, course_filter=None):
+        """
+        Answer a query, also reporting whether the answer is the one the mode is meant to give.
+
+        Returns:
+            tuple: (response, complete); complete is False for errors and for the
+                templated introduction used when the LLM failed, which shouldn't be cached
+        """
+        if self.mode == "llm":
+            try:
+                return self.generate_for_documents(query, self.retrieve(query, course_filter))
+            except Exception as e:
+                print(f"Error in query processing: {str(e)}")
+                return f"Error querying the model: {str(e)}", False
+        path_introduction, path_content, complete = self.generate_parts(query, course_filter)
+        return self._join(path_introduction, path_content), complete
+
+    def get_response_parts(self, query: str, course_filter=None, on_table=None):
+        """
+        Generate the introduction and the course table of a recommendation concurrently.
+
+        In "structured" mode the LLM writes the introduction from the query alone
+        while the courses are retrieved and the table is rendered, so the
+        latency is that of the slower of the two rather than their sum. If the
+        LLM call fails, the templated introduction is used, since the table
+        doesn't depend on it.
+
+        Args:
+            query (str): The user query
+            course_filter (CourseFilter): Restrictions applied before the vector
+                search; parsed from the query when omitted
+            on_table (callable): Called with the course table as soon as it is
+                ready, e.g. to start generating an assessment in the background
+
+        Returns:
+            tuple: (path_introduction, path_content), as returned by app_new.process_recommendation
+        """
+        return self.generate_parts(query, course_filter, on_table)[:2]
+
+    def generate_parts(self, query: str, course_filter=None, on_table=None):
+        """
+        Like get_response_parts, also reporting whether the answer is complete (see generate_response).
+
+        Returns:
+            tuple: (path_introduction, path_content, complete)
+        """
+        if self.mode == "llm":
+            response, complete = self.generate_response(query, course_filter)
+            path_introduction, path_content = split_recommendation(response)
+            if path_content and on_table is not None:
+                on_table(path_content)
+            return path_introduction, path_content, complete
+
+        introduction = None
+        if self.mode == "structured":
+            introduction = _pipeline_executor.submit(self.llm.invoke, self._build_prompt(query, []))
         try:
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-pro",  # Updated to current model name
-                temperature=1.0,
-                google_api_key=self.gemini_api_key
-            )
+            documents = self.retrieve(query, course_filter)
+        except Exception as e:
+            print(f"Error in query processing: {str(e)}")
+            return f"Error querying the model: {str(e)}", "", False
+        path_content = render_course_table(documents)
+        if on_table is not None:
+            on_table(path_content)
+
+        if introduction is None:
+            return template_introduction(documents), path_content, True
+        try:
+            return introduction.result().content.strip(), path_content, True
         except Exception as e:
-            print(f"Error initializing Gemini model: {e}")
-            print("Trying fallback model...")
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-pro",  # Fallback to older model name
-                temperature=1.0,
-                google_api_key=self.gemini_api_key
+            print(f"Error generating the introduction, using the template instead: {str(e)}")
+            return template_introduction(documents), path_content, False
+
+    def stream_response_for(self, query: str, course_filter=None):
+        """
+        Stream the answer for a query as it is generated.
+
+        Uses the same retrieval and prompt as get_response_for, but yields
+        the text chunks from the LLM as soon as they arrive. In "structured"
+        mode the courses are retrieved while the introduction streams, and the
+        table follows it in one chunk.
+
+        Args:
+            query (str): The user query
+            course_filter (CourseFilter): Restrictions applied before the vector
+                search; parsed from the query when omitted
+
+        Yields:
+            str: Chunks of the response text
+        """
+        try:
+            yield from self.stream_chunks(query, course_filter)
+        except Exception as e:
+            print(f"Error in query processing: {str(e)}")
+            yield f"Error querying the model: {str(e)}"
+
+    def stream_chunks(self, query: str, course_filter=None):
+        """
+        Like stream_response_for, but a failure is raised instead of yielded as text,
+        so callers can tell a complete response from one cut off by an error.
+        """
+        if self.mode == "structured":
+            documents = _pipeline_executor.submit(self.retrieve, query, course_filter)
+            for chunk in self.llm.stream(self._build_prompt(query, [])):
+                if chunk.content:
+                    yield chunk.content
+            yield self._compose("", documents.result())
+            return
+        documents = self.retrieve(query, course_filter)
+        if self.mode == "template":
+            yield self._compose(template_introduction(documents), documents)
+            return
+        for chunk in self.llm.stream(self._build_prompt(query, documents)):
+            if chunk.content:
+                yield chunk.content
+
+    def stream_parts(self, query: str, course_filter=None):
+        """
+        Stream a recommendation as (path_introduction, path_content) snapshots.
+
+        Each yield is the whole answer so far, so a caller can simply re-render
+        it. In "structured" mode the introduction grows chunk by chunk while the
+        courses are retrieved, and the course table appears as soon as it is
+        ready. If the introduction fails, the templated one replaces it, as in
+        get_response_parts.
+
+        Args:
+            query (str): The user query
+            course_filter (CourseFilter): Restrictions applied before the vector
+                search; parsed from the query when omitted
+
+        Yields:
+            tuple: (path_introduction, path_content)
+
+        Returns:
+            tuple: (path_introduction, path_content, complete), see generate_parts
+        """
+        if self.mode != "structured":
+            text = ""
+            try:
+                for chunk in self.stream_chunks(query, course_filter):
+                    text += chunk
+                    yield split_recommendation(text)
+            except Exception as e:
+                print(f"Error in query processing: {str(e)}")
+                message = f"Error querying the model: {str(e)}"
+                yield message, ""
+                return message, "", False
+            return (*split_recommendation(text), True)
+
+        documents = _pipeline_executor.submit(self.retrieve, query, course_filter)
+        path_introduction, path_content, complete = "", "", True
+        try:
+            for chunk in self.llm.stream(self._build_prompt(query, [])):
+                path_introduction += chunk.content or ""
+                if documents.done():
+                    if documents.exception() is not None:
+                        break
+                    path_content = path_content or render_course_table(documents.result())
+                yield path_introduction, path_content
+        except Exception as e:
+            print(f"Error generating the introduction, using the template instead: {str(e)}")
+            path_introduction, complete = None, False
+        try:
+            retrieved = documents.result()
+        except Exception as e:
+            print(f"Error in query processing: {str(e)}")
+            message = f"Error querying the model: {str(e)}"
+            yield message, ""
+            return message, "", False
+        path_content = path_content or render_course_table(retrieved)
+        path_introduction = template_introduction(retrieved) if path_introduction is None else path_introduction.strip()
+        yield path_introduction, path_content
+        return path_introduction, path_content, complete
+
+    async def aget_response_for(self, query: str, course_filter=None):
+        return (await self.agenerate_response(query, course_filter))[0]
+
+    async def agenerate_response(self, query: str, course_filter=None):
+        """
+        Async version of generate_response, with the same fallback to the templated introduction.
+        """
+        if self.mode == "llm":
+            try:
+                documents = await self.aretrieve(query, course_filter)
+                response = await self.llm.ainvoke(self._build_prompt(query, documents))
+                return response.content, True
+            except Exception as e:
+                print(f"Error in query processing: {str(e)}")
+                return f"Error querying the model: {str(e)}", False
+
+        introduction = None
+        if self.mode == "structured":
+            introduction = asyncio.ensure_future(self.llm.ainvoke(self._build_prompt(query, [])))
+        try:
+            documents = await self.aretrieve(query, course_filter)
+        except Exception as e:
+            if introduction is not None:
+                introduction.cancel()
+            print(f"Error in query processing: {str(e)}")
+            return f"Error querying the model: {str(e)}", False
+        path_content = render_course_table(documents)
+
+        if introduction is None:
+            return self._join(template_introduction(documents), path_content), True
+        try:
+            return self._join((await introduction).content.strip(), path_content), True
+        except Exception as e:
+            print(f"Error generating the introduction, using the template instead: {str(e)}")
+            return self._join(template_introduction(documents), path_content), False
+
+    async def astream_response_for(self, query: str, course_filter=None):
+        try:
+            async for chunk in self.astream_chunks(query, course_filter):
+                yield chunk
+        except Exception as e:
+            print(f"Error in query processing: {str(e)}")
+            yield f"Error querying the model: {str(e)}"
+
+    async def astream_chunks(self, query: str, course_filter=None):
+        """
+        Async version of stream_chunks: failures are raised, not yielded as text.
+        """
+        if self.mode == "structured":
+            documents = asyncio.ensure_future(self.aretrieve(query, course_filter))
+            try:
+                async for chunk in self.llm.astream(self._build_prompt(query, [])):
+                    if chunk.content:
+                        yield chunk.content
+                yield self._compose("", await documents)
+            finally:
+                documents.cancel()
+            return
+        documents = await self.aretrieve(query, course_filter)
+        if self.mode == "template":
+            yield self._compose(template_introduction(documents), documents)
+            return
+        async for chunk in self.llm.astream(self._build_prompt(query, documents)):
+            if chunk.content:
+                yield chunk.content
+
+    def retrieve(self, query: str, course_filter=None):
+        """
+        Retrieve the course rows for a query.
+
+        The catalog is first narrowed to the courses matching the filter (domain,
+        module, time budget) using the indexed columns of the docstore. The
+        candidates are then ranked by both the vector search and the BM25
+        keyword index, which run in parallel, and the two rankings are merged
+        with reciprocal-rank fusion.
+
+        Args:
+            query (str): The user query
+            course_filter (CourseFilter): Restrictions applied before the vector
+                search; parsed from the query when omitted
+
+        Returns:
+            list: The retrieved documents, best match first
+        """
+        if course_filter is None:
+            course_filter = CourseFilter.from_query(query)
+        candidates = self._candidate_positions(course_filter)
+        keyword_rankings = self._submit_keyword_search([query], candidates)
+        vector = self.faiss_vectorstore.embeddings.embed_query(query)
+        dense_rankings = self._dense_search([vector], candidates)
+        return self._fuse(dense_rankings, keyword_rankings)[0]
+
+    async def aretrieve(self, query: str, course_filter=None):
+        """
+        Retrieve the course rows for a query without blocking the event loop.
+
+        The query is embedded asynchronously while the keyword search runs in
+        the default executor, as do the CPU-bound filtering and FAISS search and
+        the fusion, which reads the matched rows from the docstore.
+        """
+        if course_filter is None:
+            course_filter = CourseFilter.from_query(query)
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(None, self._candidate_positions, course_filter)
+        keyword_rankings = self._submit_keyword_search([query], candidates)
+        vector = await self.faiss_vectorstore.embeddings.aembed_query(query)
+        dense_rankings = await loop.run_in_executor(None, self._dense_search, [vector], candidates)
+        if keyword_rankings is not None:
+            await asyncio.wrap_future(keyword_rankings)
+        fused = await loop.run_in_executor(None, self._fuse, dense_rankings, keyword_rankings)
+        return fused[0]
+
+    def retrieve_batch(self, queries):
+        """
+        Retrieve the course rows for many queries at once.
+
+        All queries are embedded in one batch; queries that share the same
+        filter are searched with a single vectorised FAISS call. The keyword
+        searches run while the queries are being embedded.
+
+        Args:
+            queries (list): The user queries
+
+        Returns:
+            list: One list of documents per query, in the same order
+        """
+        groups = {}
+        for position, query in enumerate(queries):
+            course_filter = CourseFilter.from_query(query)
+            groups.setdefault(course_filter.key(), (course_filter, []))[1].append(position)
+        searches = []
+        for course_filter, positions in groups.values():
+            candidates = self._candidate_positions(course_filter)
+            keyword_rankings = self._submit_keyword_search([queries[position] for position in positions], candidates)
+            searches.append((positions, candidates, keyword_rankings))
+
+        embeddings = self.faiss_vectorstore.embeddings
+        if hasattr(embeddings, "embed_queries"):
+            vectors = embeddings.embed_queries(queries)
+        else:
+            vectors = [embeddings.embed_query(query) for query in queries]
+
+        results = [None] * len(queries)
+        for positions, candidates, keyword_rankings in searches:
+            dense_rankings = self._dense_search([vectors[position] for position in positions], candidates)
+            for position, documents in zip(positions, self._fuse(dense_rankings, keyword_rankings)):
+                results[position] = documents
+        return results
+
+    def _candidate_positions(self, course_filter):
+        """
+        FAISS positions allowed by the filter, or None to search the whole catalog.
+        """
+        docstore = self.faiss_vectorstore.docstore
+        # Only the SQLite docstore has the indexed columns; in-memory stores are searched unfiltered
+        if course_filter.is_empty() or not isinstance(docstore, SQLiteDocstore):
+            return None
+        positions = candidate_positions(docstore, course_filter)
+        if len(positions) == 0:
+            print(f' -- No courses match {course_filter}; searching the whole catalog.')
+            return None
+        return positions
+
+    def _rank_depth(self):
+        # Each ranking goes deeper than k so that fusion can promote rows ranked high by only one of them
+        return RETRIEVER_TOP_K * HYBRID_RANK_DEPTH_FACTOR if self.keyword_index is not None else RETRIEVER_TOP_K
+
+    def _submit_keyword_search(self, queries, candidates):
+        """
+        Start the BM25 searches for the queries in the background.
+
+        Returns:
+            Future: Resolves to one ranking (list of positions) per query, or
+            None when there is no keyword index
+        """
+        if self.keyword_index is None:
+            return None
+        return _keyword_search_executor.submit(
+            lambda: [self.keyword_index.search(query, self._rank_depth(), candidates) for query in queries]
+        )
+
+    def _dense_search(self, vectors, candidates):
+        index = self.faiss_vectorstore.index
+        vectors = as_float32_matrix(vectors)
+        if candidates is None:
+            _, found = index.search(vectors, self._rank_depth())
+        else:
+            _, found = search_candidates(index, vectors, self._rank_depth(), candidates, self.ann_config)
+        # FAISS pads with -1 when there are fewer than k rows
+        return [[int(position) for position in row if position != -1] for row in found]
+
+    def _fuse(self, dense_rankings, keyword_rankings):
+        """
+        Merge the dense and keyword rankings and fetch the top documents.
+
+        Args:
+            dense_rankings (list): One list of positions per query
+            keyword_rankings (Future): Result of _submit_keyword_search, or None
+
+        Returns:
+            list: One list of documents per query
+        """
+        if keyword_rankings is None:
+            rankings = [ranking[:RETRIEVER_TOP_K] for ranking in dense_rankings]
+        else:
+            rankings = [
+                reciprocal_rank_fusion([dense, keyword], RETRIEVER_TOP_K)
+                for dense, keyword in zip(dense_rankings, keyword_rankings.result())
+            ]
+
+        results = []
+        for ranking in rankings:
+            documents = []
+            for position in ranking:
+                doc_id = self.faiss_vectorstore.index_to_docstore_id[position]
+                documents.append(self.faiss_vectorstore.docstore.search(doc_id))
+            results.append(documents)
+        return results
+
+    def generate_for_documents(self, query, documents):
+        """
+        Generate the answer for a query from already retrieved course rows.
+
+        Unlike get_response_for, errors are raised rather than returned as text,
+        except in "structured" mode, where a failed introduction falls back to the
+        templated one as in generate_parts.
+
+        Returns:
+            tuple: (response, complete), as returned by generate_response
+        """
+        if self.mode == "template":
+            return self._compose(template_introduction(documents), documents), True
+        if self.mode == "structured":
+            try:
+                introduction = self.llm.invoke(self._build_prompt(query, documents)).content
+            except Exception as e:
+                print(f"Error generating the introduction, using the template instead: {str(e)}")
+                return self._compose(template_introduction(documents), documents), False
+            return self._compose(introduction, documents), True
+        return self.llm.invoke(self._build_prompt(query, documents)).content, True
+
+    def _build_prompt(self, query, documents):
+        if self.mode == "structured":
+            # The introduction is written from the query alone
+            return self.INTRODUCTION_PROMPT.format(question=query)
+        # Only the best-ranked distinct rows that fit PROMPT_CONTEXT_TOKEN_BUDGET go into the context
+        context = "\n\n".join(document.page_content for document in pack_documents(documents))
+        return self.PROMPT.format(context=context, question=query)
+
+    @staticmethod
+    def _join(path_introduction, path_content):
+        return f"{path_introduction}\n\n{path_content}" if path_content else path_introduction
+
+    @staticmethod
+    def _compose(introduction, documents):
+        # Same layout as the LLM-written answer: the introduction, then the course table
+        return f"{introduction.strip()}\n\n{render_course_table(documents)}"
+
+class LearningPathRecommendationEngine:
+    """
+    Long-lived recommendation engine shared by every request in the process.
+
+    The FAISS index and the Gemini client are loaded once and all queries are
+    served from them. Call reload() to pick up a changed CSV file without
+    restarting the process; queries keep using the previous index until the
+    new one is fully loaded.
+    """
+
+    def __init__(self, csv_filename="one.csv"):
+        self.csv_filename = csv_filename
+        self.loaded_at = None
+        self.source_signature = None
+        self.index_version = None
+        self._index_lease = None
+        self._genai_index = None
+        self._reload_lock = threading.Lock()
+        self.response_cache = ResponseCache(
+            embed_query=lambda text: self._genai_index.faiss_vectorstore.embeddings.embed_query(text)
+        )
+        # Concurrent identical queries share one retrieval and LLM call
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        self.reload()
+
+    def reload(self):
+        """
+        Rebuild (if needed) and reload the index, then swap it in atomically.
+
+        Returns:
+            datetime: When the new index was loaded
+        """
+        with self._reload_lock:
+            print(f' -- Loading learning path engine for "{self.csv_filename}".')
+            # Taken before reading, so a change made during the build is picked up by the next reload
+            source_signature = file_signature(self.csv_filename)
+            index_embeddings = GenerateLearningPathIndexEmbeddings(self.csv_filename)
+            current = self._genai_index
+            genai_index = GenAILearningPathIndex(
+                index_embeddings.get_faiss_vector_store(),
+                llm=current.llm if current is not None else None,
+                ann_config=index_embeddings.ann_config,
+                keyword_index=index_embeddings.get_keyword_index()
             )
+            # A single attribute assignment, so readers see either the old or the new index
+            self._genai_index = genai_index
+            # Answers generated from the previous index must not be served any more
+            self.response_cache.invalidate()
+            self.source_signature = source_signature
+            self.index_version = index_embeddings.index_version
+            # The previous version may now be pruned by whichever process builds next
+            previous_lease, self._index_lease = self._index_lease, index_embeddings.index_lease
+            if previous_lease is not None:
+                previous_lease.release()
+            self.loaded_at = datetime.now()
+            print(f' -- Learning path engine ready (loaded at {self.loaded_at:%Y-%m-%d %H:%M:%S}).')
+            return self.loaded_at
+
+    def get_faiss_vector_store(self):
+        return self._genai_index.faiss_vectorstore
 
     def get_response_for(self, query: str):
+        generation = self.response_cache.generation
+        cached = self.response_cache.get(query)
+        if cached is not None:
+            return cached
+
+        return self._flights.do(
+            (generation, ResponseCache.normalize(query)),
+            self._generate_response, query, generation
+        )
+
+    def _generate_response(self, query, generation):
+        response, complete = self._genai_index.generate_response(query)
+        # Failures and fallback answers are not cached, so the next request tries the LLM again
+        if complete:
+            self.response_cache.put(query, response, generation)
+        return response
+
+    def stream_response_for(self, query: str):
+        generation = self.response_cache.generation
+        cached = self.response_cache.get(query)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
         try:
-            # Create a retriever from the vector store
-            retriever = self.faiss_vectorstore.as_retriever()
-            
-            # Create the QA chain using the updated approach for newer LangChain versions
-            qa = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=retriever,
-                return_source_documents=False,
-                chain_type_kwargs={"prompt": self.PROMPT}
-            )
-            
-            # Execute the query properly - this is the fixed part
-            result = qa.invoke({"query": query})
-            
-            # Handle different response formats from various LangChain versions
-            if isinstance(result, dict) and "result" in result:
-                return result["result"]
-            elif isinstance(result, str):
-                return result
+            for chunk in self._genai_index.stream_chunks(query):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            # The chunks already sent are kept; only a complete response is cached
+            print(f"Error in query processing: {str(e)}")
+            yield f"Error querying the model: {str(e)}"
+            return
+        self.response_cache.put(query, "".join(chunks), generation)
+
+    def get_response_parts(self, query: str, on_table=None):
+        """
+        Answer a query as separate (path_introduction, path_content) parts.
+
+        See GenAILearningPathIndex.get_response_parts; answers are cached the
+        same way as get_response_for.
+        """
+        generation = self.response_cache.generation
+        cached = self.response_cache.get(query)
+        if cached is not None:
+            path_introduction, path_content = split_recommendation(cached)
+            if path_content and on_table is not None:
+                on_table(path_content)
+            return path_introduction, path_content
+
+        path_introduction, path_content, complete = self._genai_index.generate_parts(query, on_table=on_table)
+        if complete and path_content:
+            self.response_cache.put(query, f"{path_introduction}\n\n{path_content}", generation)
+        return path_introduction, path_content
+
+    def stream_response_parts(self, query: str):
+        """
+        Stream a recommendation as (path_introduction, path_content) snapshots.
+
+        See GenAILearningPathIndex.stream_parts; complete answers are cached
+        the same way as get_response_for.
+        """
+        generation = self.response_cache.generation
+        cached = self.response_cache.get(query)
+        if cached is not None:
+            yield split_recommendation(cached)
+            return
+
+        path_introduction, path_content, complete = yield from self._genai_index.stream_parts(query)
+        if complete and path_content:
+            self.response_cache.put(query, f"{path_introduction}\n\n{path_content}", generation)
+
+    def batch_get_responses(self, queries, max_concurrency=None):
+        """
+        Answer many queries with one embedding batch and one FAISS search.
+
+        Cached queries are answered from the cache; the remaining ones are
+        generated with at most max_concurrency LLM calls at a time.
+
+        Args:
+            queries (list): The user queries
+            max_concurrency (int): Maximum number of concurrent LLM calls
+
+        Returns:
+            list: One dict per query, in order, with either "learning_path" or "error"
+        """
+        generation = self.response_cache.generation
+        genai_index = self._genai_index
+        results = [None] * len(queries)
+        pending = {}
+        for position, query in enumerate(queries):
+            cached = self.response_cache.get(query)
+            if cached is not None:
+                results[position] = {"learning_path": cached}
             else:
-                return str(result)
-                
+                # Duplicate queries in the batch are generated once
+                pending.setdefault(ResponseCache.normalize(query), []).append(position)
+        if not pending:
+            return results
+
+        unique_queries = [queries[positions[0]] for positions in pending.values()]
+        try:
+            documents = genai_index.retrieve_batch(unique_queries)
+        except Exception as e:
+            print(f"Error in batch retrieval: {str(e)}")
+            for positions in pending.values():
+                for position in positions:
+                    results[position] = {"error": f"Error retrieving learning paths: {str(e)}"}
+            return results
+
+        def generate(query, query_documents):
+            try:
+                response, complete = genai_index.generate_for_documents(query, query_documents)
+                if complete:
+                    self.response_cache.put(query, response, generation)
+                return {"learning_path": response}
+            except Exception as e:
+                print(f"Error in query processing: {str(e)}")
+                return {"error": f"Error querying the model: {str(e)}"}
+
+        with ThreadPoolExecutor(max_workers=max_concurrency or BATCH_LLM_CONCURRENCY) as executor:
+            outcomes = executor.map(generate, unique_queries, documents)
+            for positions, outcome in zip(pending.values(), outcomes):
+                for position in positions:
+                    results[position] = outcome
+        return results
+
+    async def aget_response_for(self, query: str):
+        generation = self.response_cache.generation
+        cached = await self.response_cache.aget(query)
+        if cached is not None:
+            return cached
+
+        return await self._async_flights.do(
+            (generation, ResponseCache.normalize(query)),
+            self._agenerate_response, query, generation
+        )
+
+    async def _agenerate_response(self, query, generation):
+        response, complete = await self._genai_index.agenerate_response(query)
+        if complete:
+            await self.response_cache.aput(query, response, generation)
+        return response
+
+    async def astream_response_for(self, query: str):
+        generation = self.response_cache.generation
+        cached = await self.response_cache.aget(query)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        try:
+            async for chunk in self._genai_index.astream_chunks(query):
+                chunks.append(chunk)
+                yield chunk
         except Exception as e:
+            # The chunks already sent are kept; only a complete response is cached
             print(f"Error in query processing: {str(e)}")
-            return f"Error querying the model: {str(e)}"
+            yield f"Error querying the model: {str(e)}"
+            return
+        await self.response_cache.aput(query, "".join(chunks), generation)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(csv_filename="one.csv"):
+    """
+    Return the process-wide engine for a CSV file, creating it on first use.
+
+    Args:
+        csv_filename (str): The learning path CSV file the engine is built from
+
+    Returns:
+        LearningPathRecommendationEngine: The shared engine
+    """
+    engine = _engines.get(csv_filename)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(csv_filename)
+            if engine is None:
+                engine = LearningPathRecommendationEngine(csv_filename)
+                _engines[csv_filename] = engine
+    return engine
+
+def reload_engine(csv_filename="one.csv"):
+    """
+    Reload the shared engine so that changes to the CSV file are picked up.
+
+    Args:
+        csv_filename (str): The learning path CSV file the engine is built from
+
+    Returns:
+        LearningPathRecommendationEngine: The reloaded engine
+    """
+    with _engines_lock:
+        engine = _engines.get(csv_filename)
+    if engine is None:
+        return get_engine(csv_filename)
+    engine.reload()
+    return engine
+
+def file_signature(path):
+    """
+    (modification time, size) of a file, or None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class CsvWatcher:
+    """
+    Reloads an engine in a background thread when its CSV file changes, or when
+    another process publishes a new index version.
+
+    The file is polled every interval seconds. A change is only acted on once
+    the file has looked the same for two polls in a row, so a CSV that is
+    still being written isn't indexed. Published versions are complete, so
+    those are loaded at the next poll. The reload runs on the watcher thread
+    and the engine swaps the new index in when it is ready, so requests never
+    wait for index I/O.
+    """
+
+    def __init__(self, engine, interval=None):
+        self.engine = engine
+        self.interval = interval or float(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", "5"))
+        self._pending = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="csv-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            version = current_version(FAISS_INDEX_ROOT)
+            if version is not None and version != self.engine.index_version:
+                print(f' -- FAISS vector store version "{version}" was published, reloading the learning path engine.')
+                self._reload()
+                continue
+            signature = file_signature(self.engine.csv_filename)
+            if signature is None or signature == self.engine.source_signature:
+                self._pending = None
+                continue
+            if signature != self._pending:
+                self._pending = signature
+                continue
+            self._pending = None
+            print(f' -- "{self.engine.csv_filename}" changed, reloading the learning path engine in the background.')
+            self._reload()
+
+    def _reload(self):
+        try:
+            self.engine.reload()
+        except Exception as e:
+            print(f"Error reloading learning path engine: {str(e)}")
+
+_watchers = {}
+
+def watch_engine(csv_filename="one.csv", interval=None):
+    """
+    Start reloading the shared engine whenever its CSV file changes (once per file).
+
+    Args:
+        csv_filename (str): The learning path CSV file the engine is built from
+        interval (float): Seconds between checks (default: INDEX_WATCH_INTERVAL_SECONDS)
+
+    Returns:
+        CsvWatcher: The watcher
+    """
+    engine = get_engine(csv_filename)
+    with _engines_lock:
+        watcher = _watchers.get(csv_filename)
+        if watcher is None:
+            watcher = CsvWatcher(engine, interval)
+            _watchers[csv_filename] = watcher
+    return watcher
+
+def format_profile_query(profile):
+    """
+    Turn a learner profile (as collected by the Streamlit form) into a query.
+
+    Args:
+        profile (dict): learning_category, experience_level, available_time and goals
+
+    Returns:
+        str: The recommendation query
+    """
+    return (
+        f"Generate a learning path for {profile.get('learning_category', 'General')} "
+        f"for a {str(profile.get('experience_level', 'Beginner')).lower()} "
+        f"with {profile.get('available_time', 10)} hours per week available. "
+        f"Goals: {profile.get('goals', '')}"
+    )
+
+def generate_learning_paths(items, csv_filename="one.csv", max_concurrency=None):
+    """
+    Generate learning paths for a whole cohort in one call.
+
+    Args:
+        items (list): Query strings, or dicts with either a "query" or the profile
+            fields used by format_profile_query
+        csv_filename (str): The learning path CSV file
+        max_concurrency (int): Maximum number of concurrent LLM calls
+
+    Returns:
+        list: One dict per item, in order, with either "learning_path" or "error"
+    """
+    results = [None] * len(items)
+    queries, positions = [], []
+    for position, item in enumerate(items):
+        if isinstance(item, str):
+            query = item
+        elif isinstance(item, dict):
+            query = item.get("query") or (format_profile_query(item) if item.get("learning_category") else None)
+        else:
+            query = None
+        if not query:
+            results[position] = {"error": "Each item needs a query or a learner profile"}
+            continue
+        queries.append(query)
+        positions.append(position)
+
+    if queries:
+        try:
+            responses = get_engine(csv_filename).batch_get_responses(queries, max_concurrency)
+        except Exception as e:
+            print(f"Error generating learning paths: {str(e)}")
+            responses = [{"error": f"Error generating learning paths: {str(e)}"}] * len(queries)
+        for position, response in zip(positions, responses):
+            results[position] = response
+    return results
 
 def generate_learning_path(query, csv_filename="one.csv"):
     try:
-        faiss_vectorstore = GenerateLearningPathIndexEmbeddings(csv_filename).get_faiss_vector_store()
-        genAIproject = GenAILearningPathIndex(faiss_vectorstore)
-        return genAIproject.get_response_for(query)
+        return get_engine(csv_filename).get_response_for(query)
     except Exception as e:
         import traceback
         print(f"Error generating learning path: {str(e)}")
         print(traceback.format_exc())
         return f"Error generating learning path: {str(e)}"
+
+def generate_learning_path_parts(query, csv_filename="one.csv", on_table=None):
+    """
+    Generate a learning path as its introduction and course table.
+
+    Args:
+        query (str): The user query
+        csv_filename (str): The learning path CSV file
+        on_table (callable): Called with the course table as soon as it is ready
+
+    Returns:
+        tuple: (path_introduction, path_content)
+    """
+    try:
+        return get_engine(csv_filename).get_response_parts(query, on_table=on_table)
+    except Exception as e:
+        import traceback
+        print(f"Error generating learning path: {str(e)}")
+        print(traceback.format_exc())
+        return f"Error generating learning path: {str(e)}", ""
+
+def stream_learning_path(query, csv_filename="one.csv"):
+    """
+    Stream a learning path for a query chunk by chunk.
+
+    Args:
+        query (str): The user query
+        csv_filename (str): The learning path CSV file
+
+    Yields:
+        str: Chunks of the learning path text
+    """
+    try:
+        yield from get_engine(csv_filename).stream_response_for(query)
+    except Exception as e:
+        import traceback
+        print(f"Error generating learning path: {str(e)}")
+        print(traceback.format_exc())
+        yield f"Error generating learning path: {str(e)}"
+
+def stream_learning_path_parts(query, csv_filename="one.csv"):
+    """
+    Stream a learning path as (path_introduction, path_content) snapshots.
+
+    Args:
+        query (str): The user query
+        csv_filename (str): The learning path CSV file
+
+    Yields:
+        tuple: (path_introduction, path_content), the whole answer so far
+    """
+    try:
+        yield from get_engine(csv_filename).stream_response_parts(query)
+    except Exception as e:
+        import traceback
+        print(f"Error generating learning path: {str(e)}")
+        print(traceback.format_exc())
+        yield f"Error generating learning path: {str(e)}", ""
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from course_filters import CourseFilter
+
+class ResponseCache:
+    """
+    Two-level cache for learning path answers.
+
+    The first level is an exact match on the normalised query. The second,
+    optional level returns the answer of a cached query whose embedding has a
+    cosine similarity of at least similarity_threshold with the new one, which
+    catches near-identical queries produced by the Streamlit form. A semantic
+    match must also parse to the same CourseFilter, since queries differing only
+    in the hours per week or the domain embed almost identically but are
+    answered from different courses. Entries
+    expire after ttl_seconds and the least recently used ones are evicted
+    beyond max_entries. invalidate() must be called whenever the index is
+    rebuilt.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, embed_query=None, similarity_threshold=None):
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+        if similarity_threshold is None and os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD"):
+            similarity_threshold = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD"))
+        # The semantic level is only used when both an embedder and a threshold are given
+        self.embed_query = embed_query if similarity_threshold is not None else None
+        self.similarity_threshold = similarity_threshold
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def get(self, query):
+        """
+        Look up a cached response for a query.
+
+        Args:
+            query (str): The user query
+
+        Returns:
+            str: The cached response, or None on a miss
+        """
+        key = self.normalize(query)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry["response"]
+            if self.embed_query is None or not self._entries:
+                return None
+
+        vector = self._normalized_vector(key)
+        filter_key = CourseFilter.from_query(query).key()
+        with self._lock:
+            candidates = [
+                (entry_key, entry) for entry_key, entry in self._entries.items()
+                if entry["vector"] is not None and len(entry["vector"]) == len(vector)
+                and entry["filter"] == filter_key
+            ]
+            if not candidates:
+                return None
+            similarities = np.stack([entry["vector"] for _, entry in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            best_key, best_entry = candidates[best]
+            if best_key in self._entries:
+                self._entries.move_to_end(best_key)
+            return best_entry["response"]
+
+    async def aget(self, query):
+        """
+        Async get; the semantic level embeds the query, so it runs in the default executor.
+        """
+        if self.embed_query is None:
+            return self.get(query)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, query)
+
+    async def aput(self, query, response, generation=None):
+        """
+        Async put; embedding the query for the semantic level runs in the default executor.
+        """
+        if self.embed_query is None:
+            return self.put(query, response, generation)
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, query, response, generation)
+
+    def put(self, query, response, generation=None):
+        """
+        Store a response.
+
+        Args:
+            query (str): The user query
+            response (str): The generated response
+            generation (int): The cache generation read before the response was
+                computed; stale responses from before an invalidation are dropped
+        """
+        key = self.normalize(query)
+        vector = self._normalized_vector(key) if self.embed_query is not None else None
+        filter_key = CourseFilter.from_query(query).key() if vector is not None else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = {"response": response, "vector": vector, "filter": filter_key, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def _normalized_vector(self, text):
+        vector = np.asarray(self.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
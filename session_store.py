@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Persistent learner sessions: the profile, generated learning path and assessment,
+# keyed by email and a random resume code. The Streamlit app writes through to the
+# store, so a refresh or another replica resumes a learner's path and assessment
+# instead of paying for LLM generation again. The resume code is only shown to the
+# learner, so knowing an email address is not enough to read or overwrite a session.
+# SESSION_STORE_BACKEND selects the backend:
+#   sqlite  a local file (SESSION_STORE_PATH), shared by the processes of one host
+#   redis   a Redis server (SESSION_STORE_URL), shared by every replica
+#   memory  an in-process stand-in for the networked backend, for development
+
+DEFAULT_STORE_PATH = "sessions.sqlite"
+DEFAULT_STORE_URL = "redis://localhost:6379/0"
+# Sessions not updated for this long are dropped (SESSION_TTL_SECONDS)
+DEFAULT_SESSION_TTL_SECONDS = 30 * 24 * 3600
+
+# Fields of a session, as kept in st.session_state
+SESSION_FIELDS = ("user_info", "path_introduction", "path_content", "assessment_text", "assessment_data")
+
+class SQLiteSessionBackend:
+    """
+    Sessions in a local SQLite file.
+
+    Expired sessions are ignored when read and deleted when another session is written.
+    """
+
+    def __init__(self, path=None, ttl_seconds=None):
+        self.path = path or os.getenv("SESSION_STORE_PATH", DEFAULT_STORE_PATH)
+        self.ttl_seconds = int(ttl_seconds or os.getenv("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL_SECONDS))
+        self._local = threading.local()
+
+    def connection(self):
+        # SQLite connections can't be shared between threads, so each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # WAL lets readers in other processes proceed while a session is written
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self.connection().execute(
+            "SELECT data FROM sessions WHERE key = ? AND updated_at >= ?", (key, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, data):
+        now = time.time()
+        connection = self.connection()
+        connection.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+        connection.execute(
+            "INSERT OR REPLACE INTO sessions (key, data, updated_at) VALUES (?, ?, ?)", (key, data, now)
+        )
+        connection.commit()
+
+    def delete(self, key):
+        connection = self.connection()
+        connection.execute("DELETE FROM sessions WHERE key = ?", (key,))
+        connection.commit()
+
+class RedisSessionBackend:
+    """
+    Sessions in Redis, shared by every replica of the app.
+    """
+
+    def __init__(self, url=None, ttl_seconds=None):
+        import redis
+
+        self.url = url or os.getenv("SESSION_STORE_URL", DEFAULT_STORE_URL)
+        self.ttl_seconds = int(ttl_seconds or os.getenv("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL_SECONDS))
+        self._client = redis.Redis.from_url(self.url)
+
+    def get(self, key):
+        data = self._client.get(f"session:{key}")
+        return data.decode("utf-8") if data is not None else None
+
+    def set(self, key, data):
+        self._client.set(f"session:{key}", data, ex=self.ttl_seconds)
+
+    def delete(self, key):
+        self._client.delete(f"session:{key}")
+
+class MemorySessionBackend:
+    """
+    In-process stand-in for the networked backend, with the same interface.
+
+    Sessions last as long as the process, so it only suits development and tests.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def set(self, key, data):
+        with self._lock:
+            self._sessions[key] = data
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+def create_session_backend(backend_name=None):
+    """
+    Create the session backend selected by name or by the SESSION_STORE_BACKEND variable.
+
+    Args:
+        backend_name (str): "sqlite" (default), "redis" or "memory"
+
+    Returns:
+        An object with get(key), set(key, data) and delete(key) over JSON strings
+    """
+    backend_name = (backend_name or os.getenv("SESSION_STORE_BACKEND", "sqlite")).lower()
+    if backend_name == "sqlite":
+        return SQLiteSessionBackend()
+    if backend_name == "redis":
+        return RedisSessionBackend()
+    if backend_name == "memory":
+        return MemorySessionBackend()
+    raise ValueError(f"Unknown session store backend: {backend_name}")
+
+class SessionStore:
+    """
+    Learner sessions on a backend, read through an LRU cache.
+
+    Cached sessions expire after cache_ttl_seconds, so a session saved by
+    another replica is seen within that time; saves on this replica update
+    the cache immediately.
+    """
+
+    def __init__(self, backend=None, cache_size=None, cache_ttl_seconds=None):
+        self.backend = backend or create_session_backend()
+        self.cache_size = cache_size or int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "256"))
+        self.cache_ttl_seconds = float(
+            os.getenv("SESSION_CACHE_TTL_SECONDS", "5") if cache_ttl_seconds is None else cache_ttl_seconds
+        )
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_resume_code():
+        return secrets.token_urlsafe(9)
+
+    @staticmethod
+    def session_key(email, resume_code):
+        # Neither is stored as the key; without the code the key can't be derived from the email
+        return hashlib.sha256(f"{email.strip().lower()}\0{resume_code.strip()}".encode("utf-8")).hexdigest()
+
+    def load(self, email, resume_code):
+        """
+        Load a learner's session.
+
+        Args:
+            email (str): The learner's email address
+            resume_code (str): The resume code the session was saved with
+
+        Returns:
+            dict: The saved session fields, or None if there is no session
+        """
+        key = self.session_key(email, resume_code)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.time() - entry[1] <= self.cache_ttl_seconds:
+                self._cache.move_to_end(key)
+                data = entry[0]
+            else:
+                data = None
+        if data is None:
+            data = self.backend.get(key)
+            if data is None:
+                return None
+            self._remember(key, data)
+        # Parsed on every load, so callers can't change the cached session
+        return json.loads(data)
+
+    def save(self, email, resume_code, **fields):
+        """
+        Save fields of a learner's session, keeping the fields not given.
+
+        Args:
+            email (str): The learner's email address
+            resume_code (str): The learner's resume code (see new_resume_code)
+            **fields: Session fields (see SESSION_FIELDS)
+
+        Returns:
+            dict: The saved session
+        """
+        key = self.session_key(email, resume_code)
+        session = self.load(email, resume_code) or {}
+        session.update({name: value for name, value in fields.items() if name in SESSION_FIELDS})
+        session["updated_at"] = time.time()
+        data = json.dumps(session)
+        self.backend.set(key, data)
+        self._remember(key, data)
+        return session
+
+    def delete(self, email, resume_code):
+        key = self.session_key(email, resume_code)
+        self.backend.delete(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._cache[key] = (data, time.time())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """
+    Return the process-wide session store, creating it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
@@ -0,0 +1,92 @@
+import math
+import os
+import re
+
+# Average characters per token for English text with the Gemini tokenizer.
+# Counting exactly would need an API call per prompt; this estimate errs on the high side.
+CHARS_PER_TOKEN = 4
+
+# Near-duplicate texts have at least this Jaccard similarity of their word trigrams
+DUPLICATE_SIMILARITY = 0.8
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def context_token_budget():
+    return int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1000"))
+
+def topics_token_budget():
+    return int(os.getenv("ASSESSMENT_TOPICS_TOKEN_BUDGET", "300"))
+
+def _normalize(text):
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+def _shingles(normalized_text):
+    words = normalized_text.split()
+    if len(words) < 3:
+        return {normalized_text}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+def is_near_duplicate(normalized_text, kept):
+    """
+    Whether a text repeats, or is largely contained in, one of the kept texts.
+
+    Args:
+        normalized_text (str): The candidate, as produced by _normalize
+        kept (list): (normalized_text, shingles) of the texts already kept
+    """
+    shingles = _shingles(normalized_text)
+    for kept_text, kept_shingles in kept:
+        if normalized_text in kept_text:
+            return True
+        similarity = len(shingles & kept_shingles) / max(1, len(shingles | kept_shingles))
+        if similarity >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+def pack_texts(items, budget=None, text=str):
+    """
+    Keep the best items that fit into a token budget, dropping near-duplicates.
+
+    Items are taken in the given order (best first). An item that would overflow
+    the budget is skipped, but smaller items after it may still fit.
+
+    Args:
+        items (list): Items ranked best first
+        budget (int): Token budget; defaults to PROMPT_CONTEXT_TOKEN_BUDGET
+        text (callable): Returns the prompt text of an item
+
+    Returns:
+        list: The packed items, in their original order
+    """
+    budget = context_token_budget() if budget is None else budget
+    packed, kept, used = [], [], 0
+    for item in items:
+        item_text = text(item)
+        normalized_text = _normalize(item_text)
+        if not normalized_text or is_near_duplicate(normalized_text, kept):
+            continue
+        # Separators between items cost about one token each
+        tokens = estimate_tokens(item_text) + 1
+        if used + tokens > budget:
+            continue
+        packed.append(item)
+        kept.append((normalized_text, _shingles(normalized_text)))
+        used += tokens
+    return packed
+
+def pack_documents(documents, budget=None):
+    """
+    pack_texts for LangChain documents, using their page_content.
+    """
+    return pack_texts(documents, budget, text=lambda document: document.page_content)
+
+def truncate_to_budget(text, budget):
+    """
+    Cut text to roughly budget tokens, at a line break where possible.
+    """
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip()